@@ -1,60 +1,142 @@
 import dash
-from dash.dependencies import Input, Output
+from dash.dependencies import ClientsideFunction, Input, Output
 import dash_core_components as dcc
-from dash_core_components.Dropdown import Dropdown
 import dash_html_components as html
+import dash_table
 import plotly.express as px
 import pandas as pd
+import numpy as np
 
 import plotly.graph_objects as go
+import flask
 
+import os
 from os.path import join
 from functools import reduce
+import functools
+
+try:
+    from dash import Patch
+except ImportError:
+    # dash < 2.9: every graph update resends the full figure.
+    Patch = None
+
+from data_store import YEARS, LazyYearDict, load_frame, load_neighbors, warm
+from spatial import embedding_indexes
+from panel import Panel
+from indexes import GROUP_COLUMNS, HOVER_FAMILIES, HOVER_LABELS, UnknownCompanyError, YearIndex, add_hover_columns, group_labels
+from figure_cache import LRUCache, encode
+from search import CompanySearch
+import prerender
+import metrics
+import profiler
+import centroids
+import drift
+import lod
+import selection
+import company_api
+import export
+import compression
+import raw_json
+from payload import client_year_data, compact_figure
+from timings import stage
 
 
 external_stylesheets = ['https://codepen.io/chriddyp/pen/bWLwgP.css']
 
-app = dash.Dash(__name__, external_stylesheets=external_stylesheets)
+# Responses are compressed by compression.py rather than Flask-Compress.
+app = dash.Dash(__name__, external_stylesheets=external_stylesheets, compress=False)
 
 server = app.server
+# Every server-side callback registered below, see profiler.py.
+profiler.profile_callbacks(app)
+
+def get_grp_data(df, year=2013, method='TSNE', company_name='EBAY INC', grp='GICS_SECTOR'):
+    return get_multi_grp_data(df, year=year, method=method, companies=[company_name], grp=grp)
+
+@stage('filter')
+def get_multi_grp_data(df, year=2013, method='TSNE', companies=['EBAY INC'], grp='GICS_SECTOR'):
+    return df.iloc[yr_idx_dict[str(year)].kernel_rows(grp, companies)].copy()
+
+@stage('filter')
+def get_neighbor_data(df, year=2013, company_name='EBAY INC', num_neighbors=20):
+    return df.iloc[neighbor_rows(year, company_name, num_neighbors)].copy()
+
+def neighbor_rows(year, company_name, num_neighbors):
+    company_index = yr_idx_dict[str(year)].row(company_name)
+    rows = yr_nn_dict[str(year)][company_index, :num_neighbors + 1]
+    return rows[rows >= 0]
+
+@stage('filter')
+def get_embedding_neighbor_data(df, year=2013, dim=2, companies=['EBAY INC'], num_neighbors=20):
+    return df.iloc[embedding_neighbor_rows(year, dim, companies, num_neighbors)].copy()
+
+def embedding_neighbor_rows(year, dim, companies, num_neighbors):
+    rows = yr_space_dict[str(year)][dim].neighbor_rows(yr_idx_dict[str(year)].rows(companies), num_neighbors)
+    # The selected companies first, then everyone's neighbors, each row once.
+    return pd.unique(np.concatenate([rows[:, 0], rows[:, 1:].ravel()]))
+
+def view_rows(vis_model, cluster_group, yr, comps_selected, dims, n_neighbors):
+    """Rows of ``yr_df_dict[yr]`` drawn by ``update_graph`` for these inputs, in drawing order."""
+    if vis_model not in {'OVERALL', 'BIGGEST MOVERS', 'CENTROIDS', 'MULTI-KERNEL', 'NEAREST NEIGHBORS', 'EMBEDDING NEIGHBORS', 'TRAJECTORY'}:
+        raise ValueError('Unknown visualization model %r' % (vis_model,))
+    companies = [comps_selected] if isinstance(comps_selected, (str, int)) else list(comps_selected or [])
+    if vis_model in {'OVERALL', 'BIGGEST MOVERS', 'CENTROIDS'}:
+        return np.arange(len(yr_df_dict[yr]))
+    if not companies:
+        return np.empty(0, dtype=np.intp)
+    if vis_model == 'MULTI-KERNEL':
+        return yr_idx_dict[yr].kernel_rows(cluster_group, companies)
+    if vis_model == 'NEAREST NEIGHBORS':
+        return neighbor_rows(yr, companies[0], int(n_neighbors))
+    if vis_model == 'EMBEDDING NEIGHBORS':
+        return embedding_neighbor_rows(yr, int(dims), companies, int(n_neighbors))
+    return pd.unique(yr_idx_dict[yr].rows(companies))
+
+
+@stage('figure')
+def make_figure(data, dim=2, method='TSNE', grp='GICS_SECTOR', hover='GICS_SECTOR', size=5, opacity=0.8, offset=None, compact=False, precision=3, split=None, **kwargs):
+    coords = {axis.lower(): data[axis + str(dim) + method] for axis in 'XYZ'[:dim]}
+    if offset is not None:
+        coords = {axis: values - shift for (axis, values), shift in zip(coords.items(), offset)}
+    scatter = go.Scatter if dim == 2 else go.Scatter3d
+    if compact:
+        return compact_figure(scatter, coords, data[grp + '_Color'], data['Name'], data['Label_' + hover],
+                              hover_prefix=' (GICS ' + HOVER_LABELS[hover] + ': ', size=size, opacity=opacity, precision=precision)
+    hovertext = data['Hover_' + hover]
+
+    def trace(sel):
+        return scatter(**{axis: values.iloc[sel] for axis, values in coords.items()},
+                       mode='markers',
+                       marker = {
+                           'size': size,
+                           'opacity': opacity,
+                           'color': data[grp + '_Color'].iloc[sel]
+                       },
+                       hovertext = hovertext.iloc[sel],
+                       hovertemplate = '%{hovertext}' + '<extra></extra>',
+                       **kwargs
+                       )
+
+    if split is None:
+        return go.Figure(data=trace(slice(None)))
+    # One trace per value of `split`, in sorted order, so update_graph can
+    # patch a single group in or out of the figure (see patch_graph).
+    codes, uniques = pd.factorize(data[split], sort=True)
+    fig = go.Figure(data=[trace(np.flatnonzero(codes == j)) for j in range(len(uniques))])
+    fig.update_layout(showlegend=False)
+    return fig
+
 
-def get_grp_data(df, method='TSNE', company_name='EBAY INC', grp='GICS_SECTOR'):
-    company_row = df[df['Name'] == company_name]
-    grp_value = company_row[grp].values[0]
-    return df[df[grp] == grp_value]
-
-def get_neighbor_data(df, neighbors=['EBAY INC']):
-    return df[df['Name'] in neighbors]
-
-
-def generate_vis(df, dist_matrix=None, year=2013, dim=3, method='TSNE', vis_type='OVERALL', grp='GICS_SECTOR', company='EBAY INC', num_neighbors=200, size=5, opacity=0.8, x_title='X', y_title='Y', z_title='Z', just_name=False, fig_width=800, fig_height=800, diff_grp=None, companies=[]):
-    temp_grp = grp if diff_grp == None else diff_grp
-    if temp_grp in {'GICS_SECTOR', 'ML_sector'}:
-        gics_grp = 'Sector'
-        gics_grp_str = 'GICS_SECTOR'
-    if temp_grp in {'GICS_INDUSTRY', 'ML_industry'}:
-        gics_grp = 'Industry'
-        gics_grp_str = 'GICS_INDUSTRY'
-    if temp_grp in {'GICS_SUB_INDUSTRY', 'ML_subindustry'}:
-        gics_grp = 'Sub-Industry'
-        gics_grp_str = 'GICS_SUB_INDUSTRY'
+def generate_vis(df, dist_matrix=None, year=2013, dim=3, method='TSNE', vis_type='OVERALL', grp='GICS_SECTOR', company='EBAY INC', num_neighbors=200, size=5, opacity=0.8, x_title='X', y_title='Y', z_title='Z', just_name=False, fig_width=800, fig_height=800, diff_grp=None, companies=[], compact=False, precision=3, viewport=None):
+    hover = HOVER_FAMILIES[grp if diff_grp == None else diff_grp]
     
     if dim == 2:
-        if vis_type == 'OVERALL':
-            fig = go.Figure(data=go.Scatter(x=df['X' + '2' + method], 
-                                            y=df['Y' + '2' + method],
-                                            mode='markers',
-                                            marker = {
-                                                'size': size,
-                                                'opacity': opacity,
-                                                'color': df[grp + '_Color']
-                                            },
-                                            hovertext = df['Name'] + ' (GICS ' + gics_grp + ': ' + df['Proper_' + gics_grp_str].astype(str) + ')',
-                                            text=df['Name'],
-                                            hovertemplate = '%{hovertext}' + '<extra></extra>',
-                                            hoverinfo='text'
-                                            )
-                            )
+        if vis_type == 'OVERALL' and lod_points:
+            fig = make_lod_figure(df, year=year, dim=2, method=method, grp=grp, hover=hover, size=size, opacity=opacity, compact=compact, precision=precision, viewport=viewport)
+
+        elif vis_type == 'OVERALL':
+            fig = make_figure(df, dim=2, method=method, grp=grp, hover=hover, size=size, opacity=opacity, compact=compact, precision=precision, text=df['Name'], hoverinfo='text')
             
             """
             ####
@@ -198,53 +280,23 @@ def generate_vis(df, dist_matrix=None, year=2013, dim=3, method='TSNE', vis_type
             """
 
         elif vis_type == 'KERNEL':
-            grp_data = get_grp_data(df=df, method=method, company_name=company, grp=grp)
-            company_row = df[df['Name'] == company]
-            norm_x, norm_y = company_row[['X'+str(dim)+method, 'Y'+str(dim)+method]].values[0]
-            company_index = company_row.index.values[0]
+            grp_data = get_grp_data(df=df, year=year, method=method, company_name=company, grp=grp)
+            company_index = yr_idx_dict[str(year)].row(company)
+            norm_x, norm_y = df.loc[company_index, ['X'+str(dim)+method, 'Y'+str(dim)+method]]
             grp_data.loc[company_index, grp + '_Color'] = '#000000'
-            fig = go.Figure(data=go.Scatter(x=grp_data['X' + '2' + method] - norm_x, 
-                                            y=grp_data['Y' + '2' + method] - norm_y,
-                                            mode='markers',
-                                            marker = {
-                                                'size': size,
-                                                'opacity': opacity,
-                                                'color': grp_data[grp + '_Color']
-                                            },
-                                            hovertext = grp_data['Name'] + ' (GICS ' + gics_grp + ': ' + grp_data['Proper_' + gics_grp_str].astype(str) + ')',
-                                            hovertemplate = '%{hovertext}' + '<extra></extra>'
-                                            )
-                          )
+            fig = make_figure(grp_data, dim=2, method=method, grp=grp, hover=hover, size=size, opacity=opacity, offset=(norm_x, norm_y), compact=compact, precision=precision)
         
         elif vis_type == 'MULTI-KERNEL':
             assert len(companies) >= 1
-            frames = []
-            #grp_data = pd.DataFrame()
-            for c in companies:
-                grp_data = get_grp_data(df=df, method=method, company_name=c, grp=grp)
-                frames.append(grp_data)
-            grp_data = pd.concat(frames)
+            grp_data = get_multi_grp_data(df=df, year=year, method=method, companies=companies, grp=grp)
             """
             if year == 2019 and companies[0] == 'S&P GLOBAL INC':
                 for i, row in grp_data.iterrows():
                     grp_data.loc[i, grp + '_Color'] = '#013349'
             """
-            for c in companies:
-                company_row = df[df['Name'] == c]
-                company_index = company_row.index.values[0]
-                grp_data.loc[company_index, grp + '_Color'] = '#000000'
-            fig = go.Figure(data=go.Scatter(x=grp_data['X' + '2' + method], 
-                                              y=grp_data['Y' + '2' + method],
-                                              mode='markers',
-                                              marker = {
-                                                  'size': size,
-                                                  'opacity': opacity,
-                                                  'color': grp_data[grp + '_Color']
-                                              },
-                                              hovertext = grp_data['Name'] + ' (GICS ' + gics_grp + ': ' + grp_data['Proper_' + gics_grp_str].astype(str) + ')',
-                                              hovertemplate = '%{hovertext}' + '<extra></extra>'
-                                             )
-                          )
+            # One assignment for all companies; a selection can hold hundreds.
+            grp_data.loc[yr_idx_dict[str(year)].rows(companies), grp + '_Color'] = '#000000'
+            fig = make_figure(grp_data, dim=2, method=method, grp=grp, hover=hover, size=size, opacity=opacity, compact=compact, precision=precision, split=grp)
             """
             if year == 2019 and companies[0] == 'S&P GLOBAL INC':
                 font_size = 16
@@ -356,35 +408,11 @@ def generate_vis(df, dist_matrix=None, year=2013, dim=3, method='TSNE', vis_type
             
         elif vis_type == 'NEAREST NEIGHBORS':
             
-            neighbors_df = yr_dm_dict[str(year)]
-            neighbors_list = neighbors_df[neighbors_df['Company'] == companies]["NearestNeighborsORDERED"].item()
-            neighbors_list = neighbors_list[1:len(neighbors_list) - 1]
-            neighbors_list = neighbors_list.split(", ")
-            
-            temp_list = []
-            for elt in neighbors_list:
-                temp_list.append(elt[1:len(elt) - 1])
-            
-            neighbors_list = temp_list[:num_neighbors + 1]
-
-            df = df[df['Name'].isin(neighbors_list)]
-
-            company_row = df[df['Name'] == companies]
-            company_index = company_row.index.values[0]
-            df.loc[company_index, grp + '_Color'] = '#000000'
-
-            fig = go.Figure(data=go.Scatter(x=df['X' + '2' + method], 
-                                              y=df['Y' + '2' + method],
-                                              mode='markers',
-                                              marker = {
-                                                  'size': size,
-                                                  'opacity': opacity,
-                                                  'color': df[grp + '_Color']
-                                              },
-                                              hovertext = df['Name'] + ' (GICS ' + gics_grp + ': ' + df['Proper_' + gics_grp_str].astype(str) + ')',
-                                              hovertemplate = '%{hovertext}' + '<extra></extra>'
-                                             )
-                          )
+            # The company itself is always the first neighbor row.
+            df = get_neighbor_data(df, year=year, company_name=companies, num_neighbors=num_neighbors)
+            df.loc[df.index[0], grp + '_Color'] = '#000000'
+
+            fig = make_figure(df, dim=2, method=method, grp=grp, hover=hover, size=size, opacity=opacity, compact=compact, precision=precision)
             
             ####
             # Overall 2020 NN Annotations for Fedex: HB Fuller, CSX Corp, Norfolk Southern Corp, United Parcel Service, Expeditors International of Washington, XPO Logistics, Forward Air, Landstar System, Ryder System, Werner Enterprises 
@@ -697,8 +725,7 @@ def generate_vis(df, dist_matrix=None, year=2013, dim=3, method='TSNE', vis_type
 
                 
                 for comp in orig_neighbors_list[:11]:
-                    company_row = df[df['Name'] == comp]
-                    company_index = company_row.index.values[0]
+                    company_index = yr_idx_dict[str(year)].row(comp)
                     df.loc[company_index, grp + '_Color'] = '#000000'
                     fig.add_annotation(
                         x=df.loc[company_index, 'X3TSNE'],
@@ -728,51 +755,39 @@ def generate_vis(df, dist_matrix=None, year=2013, dim=3, method='TSNE', vis_type
             """
             
             
+        elif vis_type == 'EMBEDDING NEIGHBORS':
+            companies = [companies] if isinstance(companies, str) else companies
+            df = get_embedding_neighbor_data(df, year=year, dim=2, companies=companies, num_neighbors=num_neighbors)
+            df.loc[yr_idx_dict[str(year)].rows(companies), grp + '_Color'] = '#000000'
+            fig = make_figure(df, dim=2, method=method, grp=grp, hover=hover, size=size, opacity=opacity, compact=compact, precision=precision)
+
+        elif vis_type == 'TRAJECTORY':
+            companies = [companies] if isinstance(companies, str) else companies
+            fig = make_trajectory(year=year, dim=2, method=method, companies=companies, grp=grp, size=size, opacity=opacity)
+
+        elif vis_type == 'BIGGEST MOVERS':
+            fig = make_movers(df, year=year, dim=2, method=method, size=size, opacity=opacity)
+
+        elif vis_type == 'CENTROIDS':
+            fig = make_centroids(df, year=year, dim=2, grp=grp, size=size, opacity=opacity)
+
     else:
-        if vis_type == 'OVERALL':
-            fig = go.Figure(data=go.Scatter3d(x=df['X' + '3' + method], 
-                                              y=df['Y' + '3' + method],
-                                              z=df['Z' + '3' + method],
-                                              mode='markers',
-                                              marker = {
-                                                  'size': size,
-                                                  'opacity': opacity,
-                                                  'color': df[grp + '_Color']
-                                              },
-                                              hovertext = df['Name'] + ' (GICS ' + gics_grp + ': ' + df['Proper_' + gics_grp_str].astype(str) + ')',
-                                              #text=df['Name'] + ' (GICS ' + gics_grp + ': ' + df['Proper_' + gics_grp_str].astype(str) + ')',
-                                              hovertemplate = '%{hovertext}' + '<extra></extra>'
-                                             )
-                          )
+        if vis_type == 'OVERALL' and lod_points:
+            fig = make_lod_figure(df, year=year, dim=3, method=method, grp=grp, hover=hover, size=size, opacity=opacity, compact=compact, precision=precision)
+
+        elif vis_type == 'OVERALL':
+            fig = make_figure(df, dim=3, method=method, grp=grp, hover=hover, size=size, opacity=opacity, compact=compact, precision=precision)
         
         elif vis_type == 'KERNEL':
-            grp_data = get_grp_data(df=df, method=method, company_name=company, grp=grp)
-            company_row = df[df['Name'] == company]
-            norm_x, norm_y, norm_z = company_row[['X'+str(dim)+method, 'Y'+str(dim)+method, 'Z'+str(dim)+method]].values[0]
-            company_index = company_row.index.values[0]
+            grp_data = get_grp_data(df=df, year=year, method=method, company_name=company, grp=grp)
+            company_index = yr_idx_dict[str(year)].row(company)
+            norm_x, norm_y, norm_z = df.loc[company_index, ['X'+str(dim)+method, 'Y'+str(dim)+method, 'Z'+str(dim)+method]]
             grp_data.loc[company_index, grp + '_Color'] = '#000000'
-            fig = go.Figure(data=go.Scatter3d(x=grp_data['X' + '3' + method] - norm_x, 
-                                              y=grp_data['Y' + '3' + method] - norm_y,
-                                              z=grp_data['Z' + '3' + method] - norm_z,
-                                              mode='markers',
-                                              marker = {
-                                                  'size': size,
-                                                  'opacity': opacity,
-                                                  'color': grp_data[grp + '_Color']
-                                              },
-                                              hovertext = grp_data['Name'] + ' (GICS ' + gics_grp + ': ' + grp_data['Proper_' + gics_grp_str].astype(str) + ')',
-                                              hovertemplate = '%{hovertext}' + '<extra></extra>'
-                                             )
-                          )
+            fig = make_figure(grp_data, dim=3, method=method, grp=grp, hover=hover, size=size, opacity=opacity, offset=(norm_x, norm_y, norm_z), compact=compact, precision=precision)
             
         elif vis_type == 'MULTI-KERNEL':
             assert len(companies) >= 1
-            frames = []
-            #grp_data = pd.DataFrame()
-            for c in companies:
-                grp_data = get_grp_data(df=df, method=method, company_name=c, grp=grp)
-                frames.append(grp_data)
-            grp_data = pd.concat(frames)
+            grp_data = get_multi_grp_data(df=df, year=year, method=method, companies=companies, grp=grp)
             """
             if year == 2019 and companies[0] == 'S&P GLOBAL INC':
                 for i, row in grp_data.iterrows():
@@ -780,57 +795,17 @@ def generate_vis(df, dist_matrix=None, year=2013, dim=3, method='TSNE', vis_type
                     #grp_data.loc[i, grp + '_Color'] = '#5B4534'
                     grp_data.loc[i, grp + '_Color'] = '#5EBCD1'
             """
-            for c in companies:
-                company_row = df[df['Name'] == c]
-                company_index = company_row.index.values[0]
-                grp_data.loc[company_index, grp + '_Color'] = '#000000'
-            fig = go.Figure(data=go.Scatter3d(x=grp_data['X' + '3' + method], 
-                                              y=grp_data['Y' + '3' + method],
-                                              z=grp_data['Z' + '3' + method],
-                                              mode='markers',
-                                              marker = {
-                                                  'size': size,
-                                                  'opacity': opacity,
-                                                  'color': grp_data[grp + '_Color']
-                                              },
-                                              hovertext = grp_data['Name'] + ' (GICS ' + gics_grp + ': ' + grp_data['Proper_' + gics_grp_str].astype(str) + ')',
-                                              hovertemplate = '%{hovertext}' + '<extra></extra>'
-                                             )
-                          )
+            # One assignment for all companies; a selection can hold hundreds.
+            grp_data.loc[yr_idx_dict[str(year)].rows(companies), grp + '_Color'] = '#000000'
+            fig = make_figure(grp_data, dim=3, method=method, grp=grp, hover=hover, size=size, opacity=opacity, compact=compact, precision=precision, split=grp)
         
         elif vis_type == "NEAREST NEIGHBORS":
 
-            neighbors_df = yr_dm_dict[str(year)]
-            neighbors_list = neighbors_df[neighbors_df['Company'] == companies]["NearestNeighborsORDERED"].item()
-            neighbors_list = neighbors_list[1:len(neighbors_list) - 1]
-            neighbors_list = neighbors_list.split(", ")
-            
-            temp_list = []
-            for elt in neighbors_list:
-                temp_list.append(elt[1:len(elt) - 1])
-            
-            orig_neighbors_list = temp_list
-            neighbors_list = temp_list[:num_neighbors + 1]
-
-            df = df[df['Name'].isin(neighbors_list)]
-
-            company_row = df[df['Name'] == companies]
-            company_index = company_row.index.values[0]
-            df.loc[company_index, grp + '_Color'] = '#000000'
-
-            fig = go.Figure(data=go.Scatter3d(x=df['X' + '3' + method], 
-                                              y=df['Y' + '3' + method],
-                                              z=df['Z' + '3' + method],
-                                              mode='markers',
-                                              marker = {
-                                                  'size': size,
-                                                  'opacity': opacity,
-                                                  'color': df[grp + '_Color']
-                                              },
-                                              hovertext = df['Name'] + ' (GICS ' + gics_grp + ': ' + df['Proper_' + gics_grp_str].astype(str) + ')',
-                                              hovertemplate = '%{hovertext}' + '<extra></extra>'
-                                             )
-                          )
+            # The company itself is always the first neighbor row.
+            df = get_neighbor_data(df, year=year, company_name=companies, num_neighbors=num_neighbors)
+            df.loc[df.index[0], grp + '_Color'] = '#000000'
+
+            fig = make_figure(df, dim=3, method=method, grp=grp, hover=hover, size=size, opacity=opacity, compact=compact, precision=precision)
             
             ####
             # Overall 2020 NN Annotations for Fedex: HB Fuller, CSX Corp, Norfolk Southern Corp, United Parcel Service, Expeditors International of Washington, XPO Logistics, Forward Air, Landstar System, Ryder System, Werner Enterprises 
@@ -919,8 +894,7 @@ def generate_vis(df, dist_matrix=None, year=2013, dim=3, method='TSNE', vis_type
 
                 
                 for comp in orig_neighbors_list[:11]:
-                    company_row = df[df['Name'] == comp]
-                    company_index = company_row.index.values[0]
+                    company_index = yr_idx_dict[str(year)].row(comp)
                     df.loc[company_index, grp + '_Color'] = '#000000'
                     fig.add_annotation(
                         x=df.loc[company_index, 'X3TSNE'],
@@ -949,8 +923,27 @@ def generate_vis(df, dist_matrix=None, year=2013, dim=3, method='TSNE', vis_type
                     )
             """  
 
-            
-    
+        elif vis_type == 'EMBEDDING NEIGHBORS':
+            companies = [companies] if isinstance(companies, str) else companies
+            df = get_embedding_neighbor_data(df, year=year, dim=3, companies=companies, num_neighbors=num_neighbors)
+            df.loc[yr_idx_dict[str(year)].rows(companies), grp + '_Color'] = '#000000'
+            fig = make_figure(df, dim=3, method=method, grp=grp, hover=hover, size=size, opacity=opacity, compact=compact, precision=precision)
+
+        elif vis_type == 'TRAJECTORY':
+            companies = [companies] if isinstance(companies, str) else companies
+            fig = make_trajectory(year=year, dim=3, method=method, companies=companies, grp=grp, size=size, opacity=opacity)
+
+        elif vis_type == 'BIGGEST MOVERS':
+            fig = make_movers(df, year=year, dim=3, method=method, size=size, opacity=opacity)
+
+        elif vis_type == 'CENTROIDS':
+            fig = make_centroids(df, year=year, dim=3, grp=grp, size=size, opacity=opacity)
+
+    return apply_layout(fig, x_title=x_title, y_title=y_title, z_title=z_title, fig_width=fig_width, fig_height=fig_height)
+
+
+@stage('figure')
+def apply_layout(fig, x_title='X', y_title='Y', z_title='Z', fig_width=800, fig_height=800):
     fig.update_layout(scene=dict(
                             xaxis_title=x_title,
                             yaxis_title=y_title,
@@ -961,7 +954,6 @@ def generate_vis(df, dist_matrix=None, year=2013, dim=3, method='TSNE', vis_type
                         margin=dict(t=30, r=0, l=20, b=10)
     )
 
-    name = str(year) + ' ' + method + ' ' + vis_type
     camera = dict(
         up=dict(x=0, y=0, z=1),
         center=dict(x=0,y=0,z=0),
@@ -974,43 +966,212 @@ def generate_vis(df, dist_matrix=None, year=2013, dim=3, method='TSNE', vis_type
     return fig
 
 
+@stage('figure')
+def make_trajectory(year=2013, dim=2, method='TSNE', companies=['EBAY INC'], grp='GICS_SECTOR', size=5, opacity=0.8):
+    # Companies are picked by name in `year` and followed by SID.
+    panel = company_panel()
+    df = yr_df_dict[str(year)]
+    sids = pd.unique(df['SID'].to_numpy()[yr_idx_dict[str(year)].rows(companies)])
+    i = panel.index(sids)
+    coords, mask = panel.trajectories(sids, dim)
+    names = panel.latest_names(sids)
+    colors = np.where(mask, panel.palettes[grp][panel.color_codes[grp][i]], '#000000')
+    labels = [year_labels[yr] for yr in panel.years]
+    scatter = go.Scatter if dim == 2 else go.Scatter3d
+    axes = 'xyz'[:dim]
+
+    # One faint path per company through every year it exists (gaps where it
+    # does not), plus one trace of the selected companies' current positions
+    # that the animation frames move from year to year.
+    traces = []
+    for k, name in enumerate(names):
+        traces.append(scatter(**{axis: coords[k, :, a] for a, axis in enumerate(axes)},
+                              mode='lines+markers',
+                              line={'color': colors[k][mask[k]][-1], 'width': 1},
+                              marker={'size': size / 2, 'opacity': opacity / 2, 'color': colors[k]},
+                              hovertext=[name + ' (' + label + ')' for label in labels],
+                              hovertemplate='%{hovertext}<extra></extra>',
+                              connectgaps=False))
+
+    def current(j):
+        return scatter(**{axis: coords[:, j, a] for a, axis in enumerate(axes)},
+                       mode='markers+text',
+                       marker={'size': size * 1.5, 'opacity': 1, 'color': '#000000'},
+                       text=names,
+                       textposition='top center',
+                       hovertext=[name + ' (' + labels[j] + ')' for name in names],
+                       hovertemplate='%{hovertext}<extra></extra>')
+
+    start = panel.years.index(str(year))
+    fig = go.Figure(data=traces + [current(start)],
+                    frames=[go.Frame(name=label, data=[current(j)], traces=[len(traces)]) for j, label in enumerate(labels)])
+    play = {'frame': {'duration': 800, 'redraw': dim == 3}, 'transition': {'duration': 300}, 'fromcurrent': True}
+    fig.update_layout(
+        showlegend=False,
+        updatemenus=[{'type': 'buttons', 'showactive': False, 'x': 0, 'y': 0, 'xanchor': 'left', 'yanchor': 'top',
+                      'buttons': [{'label': 'Play', 'method': 'animate', 'args': [None, play]},
+                                  {'label': 'Pause', 'method': 'animate',
+                                   'args': [[None], {'frame': {'duration': 0, 'redraw': False}, 'mode': 'immediate'}]}]}],
+        sliders=[{'active': start, 'x': 0.1, 'len': 0.9, 'currentvalue': {'prefix': 'Year: '},
+                  'steps': [{'label': label, 'method': 'animate',
+                             'args': [[label], {'frame': {'duration': 0, 'redraw': dim == 3}, 'mode': 'immediate'}]}
+                            for label in labels]}],
+    )
+    return fig
 
-df_2013 = pd.read_csv('cons_data1_' + '2013' +'.csv')
-df_2014 = pd.read_csv('cons_data1_' + '2014' +'.csv')
-df_2015 = pd.read_csv('cons_data1_' + '2015' +'.csv')
-df_2016 = pd.read_csv('cons_data1_' + '2016' +'.csv')
-df_2017 = pd.read_csv('cons_data1_' + '2017' +'.csv')
-df_2018 = pd.read_csv('cons_data1_' + '2018' +'.csv')
-df_2019 = pd.read_csv('cons_data1_' + '2019' +'.csv')
 
-yr_df_dict = {
-    "2013": df_2013,
-    "2014": df_2014,
-    "2015": df_2015,
-    "2016": df_2016,
-    "2017": df_2017,
-    "2018": df_2018,
-    "2019": df_2019
-}
+@stage('figure')
+def make_movers(df, year=2014, dim=2, method='TSNE', size=5, opacity=0.8):
+    # Companies colored by how much of their nearest-neighbor set they kept
+    # from the year before, biggest movers drawn last; new companies in grey.
+    records = drift.biggest_movers(neighbor_drift(), year)[::-1]
+    idx = yr_idx_dict[str(year)]
+    rows = np.array([idx.sid_rows[sid] for sid in records['sid'].tolist()], dtype=np.intp)
+    new = np.setdiff1d(np.arange(len(df)), rows)
+    cols = [axis + str(dim) + method for axis in 'XYZ'[:dim]]
+    coords = df[cols].to_numpy()
+    names = df['Name'].to_numpy(dtype=object)
+    scatter = go.Scatter if dim == 2 else go.Scatter3d
+    axes = 'xyz'[:dim]
+
+    hover = [name + '<br>Neighbors kept (rank-weighted): %.2f<br>Jaccard: %.2f<br>Shared neighbors: %d of %d'
+             % (overlap, jaccard, shared, drift.MAX_K)
+             for name, overlap, jaccard, shared in zip(names[rows], records['overlap'].tolist(),
+                                                       records['jaccard'].tolist(), records['shared'].tolist())]
+    fig = go.Figure([
+        scatter(**{axis: coords[new, a] for a, axis in enumerate(axes)}, mode='markers',
+                marker={'size': size, 'opacity': opacity / 2, 'color': '#c7c7c7'},
+                hovertext=[name + ('<br>No earlier year' if str(year) == YEARS[0] else '<br>New this year') for name in names[new]],
+                hovertemplate='%{hovertext}<extra></extra>'),
+        scatter(**{axis: coords[rows, a] for a, axis in enumerate(axes)}, mode='markers',
+                marker={'size': size, 'opacity': opacity, 'color': records['overlap'], 'cmin': 0, 'cmax': 1,
+                        'colorscale': 'Viridis', 'reversescale': True,
+                        'colorbar': {'title': 'Neighbors kept'}},
+                hovertext=hover, hovertemplate='%{hovertext}<extra></extra>'),
+    ])
+    fig.update_layout(showlegend=False)
+    return fig
 
-d_matrix_2013 = pd.read_csv('d_matrix_' + '2013' +'.csv')
-d_matrix_2014 = pd.read_csv('d_matrix_' + '2014' +'.csv')
-d_matrix_2015 = pd.read_csv('d_matrix_' + '2015' +'.csv')
-d_matrix_2016 = pd.read_csv('d_matrix_' + '2016' +'.csv')
-d_matrix_2017 = pd.read_csv('d_matrix_' + '2017' +'.csv')
-d_matrix_2018 = pd.read_csv('d_matrix_' + '2018' +'.csv')
-d_matrix_2019 = pd.read_csv('d_matrix_' + '2019' +'.csv')
-
-yr_dm_dict = {
-    "2013": d_matrix_2013,
-    "2014": d_matrix_2014,
-    "2015": d_matrix_2015,
-    "2016": d_matrix_2016,
-    "2017": d_matrix_2017,
-    "2018": d_matrix_2018,
-    "2019": d_matrix_2019
+
+@stage('figure')
+def make_centroids(df, year=2013, dim=2, grp='GICS_SECTOR', size=5, opacity=0.8):
+    # One marker per group at its members' mean position, its area
+    # proportional to the member count (see centroids.py).
+    stats = yr_centroid_dict[str(year)][grp]
+    idx = yr_idx_dict[str(year)]
+    codes = np.arange(len(stats))
+    labels = group_labels(df, idx, grp, codes)
+    if grp not in HOVER_LABELS:
+        labels = ['ML cluster ' + label for label in labels]
+    nearest = np.searchsorted(idx.group_values[grp], stats['nearest%d' % dim])
+    hover = ['%s: %d companies<br>Distance to centroid: mean %.2f, max %.2f' % (label, members, mean, largest)
+             + ('<br>Nearest group: %s (%.2f away)' % (labels[near], near_dist) if near_group >= 0 else '')
+             for label, members, mean, largest, near_group, near, near_dist
+             in zip(labels, stats['members'].tolist(), stats['mean_dist%d' % dim].tolist(), stats['max_dist%d' % dim].tolist(),
+                    stats['nearest%d' % dim].tolist(), nearest.tolist(), stats['nearest_dist%d' % dim].tolist())]
+    centers = stats['centroid%d' % dim]
+    scatter = go.Scatter if dim == 2 else go.Scatter3d
+    fig = go.Figure(scatter(**{axis: centers[:, a] for a, axis in enumerate('xyz'[:dim])},
+                            mode='markers',
+                            marker={'size': stats['members'], 'sizemode': 'area', 'sizemin': size,
+                                    'sizeref': 2 * stats['members'].max() / 60 ** 2, 'opacity': opacity,
+                                    'color': df[grp + '_Color'].to_numpy()[[idx.group_members[grp][c][0] for c in codes.tolist()]]},
+                            hovertext=hover, hovertemplate='%{hovertext}<extra></extra>'))
+    fig.update_layout(showlegend=False)
+    return fig
+
+
+@stage('figure')
+def make_lod_figure(df, year=2013, dim=2, method='TSNE', grp='GICS_SECTOR', hover='GICS_SECTOR', size=5, opacity=0.8, compact=False, precision=3, viewport=None):
+    # At most lod_points markers: the companies themselves if few enough are
+    # in view, otherwise one marker per grid cell and group (see lod.py).
+    rows = np.arange(len(df)) if viewport is None else yr_space_dict[str(year)][dim].query_box(*viewport)
+    if len(rows) <= lod_points:
+        data = df.iloc[rows]
+        fig = make_figure(data, dim=dim, method=method, grp=grp, hover=hover, size=size, opacity=opacity, compact=compact, precision=precision, text=data['Name'], hoverinfo='text')
+    else:
+        coords = df[[axis + str(dim) + method for axis in 'XYZ'[:dim]]].to_numpy()[rows]
+        centers, counts, reps = lod.aggregate(coords, yr_idx_dict[str(year)].group_codes[grp][rows].astype(np.int64), lod_points)
+        reps = rows[reps]
+        # Companies without a name have no hover text.
+        hovertext = [text if n == 1 else '%d companies' % n + (' near ' + text if isinstance(text, str) else '')
+                     for n, text in zip(counts.tolist(), df['Hover_' + hover].to_numpy(dtype=object)[reps].tolist())]
+        scatter = go.Scatter if dim == 2 else go.Scatter3d
+        fig = go.Figure(scatter(**{axis: centers[:, a] for a, axis in enumerate('xyz'[:dim])},
+                                mode='markers',
+                                marker={'size': np.maximum(size, 4 * size * np.sqrt(counts / counts.max())),
+                                        'opacity': opacity, 'color': df[grp + '_Color'].to_numpy()[reps]},
+                                hovertext=hovertext, hovertemplate='%{hovertext}<extra></extra>'))
+    if viewport is not None:
+        # Keep the zoom; open-ended bounds stop at the data.
+        points = yr_space_dict[str(year)][dim].points
+        lo = np.where(np.isfinite(viewport[0]), viewport[0], points.min(axis=0))
+        hi = np.where(np.isfinite(viewport[1]), viewport[1], points.max(axis=0))
+        fig.update_layout(xaxis_range=[lo[0], hi[0]], yaxis_range=[lo[1], hi[1]])
+    return fig
+
+
+# Each frame carries precomputed hover strings (see indexes.add_hover_columns).
+yr_df_dict = LazyYearDict(lambda yr: add_hover_columns(load_frame('cons_data1', yr)))
+yr_dm_dict = LazyYearDict(lambda yr: load_frame('d_matrix', yr))
+# Name/SID -> row position, so company lookups never scan the frame.
+yr_idx_dict = LazyYearDict(lambda yr: YearIndex(yr_df_dict[yr], year=yr))
+# Row positions of each company's nearest neighbors, parsed once from yr_dm_dict.
+yr_nn_dict = LazyYearDict(lambda yr: load_neighbors(yr, yr_df_dict, yr_dm_dict))
+# Spatial indexes over the 2D and 3D embeddings, for any-k neighbor queries.
+yr_space_dict = LazyYearDict(lambda yr: embedding_indexes(yr_df_dict[yr]))
+# Centroid and dispersion of every group of every grouping column, cached on disk.
+yr_centroid_dict = LazyYearDict(lambda yr: {grp: centroids.load_centroids(yr, yr_df_dict, yr_idx_dict, grp) for grp in GROUP_COLUMNS})
+# Type-ahead search over names and SIDs, for the companies dropdown.
+yr_search_dict = LazyYearDict(lambda yr: CompanySearch(yr_df_dict[yr]['Name'].tolist(), yr_df_dict[yr]['SID'].tolist()))
+
+# Every company across every year, aligned by SID; built on first use.
+@functools.lru_cache(maxsize=1)
+def company_panel():
+    return Panel(yr_df_dict)
+
+# Year-over-year drift of every company's nearest neighbors, cached on disk per k.
+@functools.lru_cache(maxsize=None)
+def neighbor_drift(k=drift.MAX_K):
+    return drift.load_drift(yr_df_dict, yr_nn_dict, k)
+
+def company_names(year, sids):
+    idx = yr_idx_dict[str(year)]
+    return yr_df_dict[str(year)]['Name'].to_numpy()[[idx.sid_rows[sid] for sid in np.asarray(sids).tolist()]]
+
+# Years load on first use; set PRELOAD_DATA=1 to parse them all up front.
+if os.environ.get('PRELOAD_DATA'):
+    warm(yr_df_dict, yr_nn_dict, yr_idx_dict, yr_space_dict, yr_search_dict, yr_centroid_dict)
+    company_panel()
+    neighbor_drift()
+
+# COMPACT_FIGURES=1 sends color codes, rounded coordinates and per-trace
+# hover labels instead of per-point strings (see payload.py).
+figure_options = {
+    'compact': os.environ.get('COMPACT_FIGURES', '') not in ('', '0'),
+    'precision': int(os.environ.get('FIGURE_PRECISION', 3)),
 }
 
+# CLIENTSIDE_FIGURES=1 ships each year's data to the browser once and draws
+# the graph in assets/clientside.js instead of calling update_graph.
+clientside_figures = os.environ.get('CLIENTSIDE_FIGURES', '') not in ('', '0')
+yr_client_dict = LazyYearDict(lambda yr: client_year_data(yr, yr_df_dict[yr], yr_idx_dict[yr], yr_nn_dict[yr],
+                                                          apply_layout(go.Figure()).to_plotly_json()['layout']))
+
+# LOD_POINTS=n caps OVERALL views at n markers, aggregating when zoomed out
+# and redrawing the 2D view for each zoom (see lod.py).  Off by default.
+lod_points = int(os.environ.get('LOD_POINTS', 0))
+
+figure_cache = LRUCache(max_entries=int(os.environ.get('FIGURE_CACHE_SIZE', 256)),
+                        max_bytes=int(os.environ.get('FIGURE_CACHE_MB', 64)) * 1024 * 1024)
+
+# Companies dropdown: matches sent per keystroke.  Options carry their own
+# search text from Dash 2.1; before that the browser matches labels only.
+search_limit = int(os.environ.get('SEARCH_LIMIT', 50))
+dropdown_search = tuple(int(v) for v in dash.__version__.split('.')[:2]) >= (2, 1)
+
+year_labels = {'2013': '2014', '2014': '2015', '2015': '2016', '2016': '2017', '2017': '2018', '2018': '2019', '2019': '2020'}
+
 num_neighbors_options = []
 
 min_num_neighbors = 1
@@ -1019,6 +1180,27 @@ max_num_neighbors = 20
 for i in range(1, max_num_neighbors + 1):
     num_neighbors_options.append({'label': str(i), 'value': str(i)})
 
+# The embedding index is not limited to the 20 precomputed neighbors.
+max_embedding_neighbors = 500
+embedding_neighbors_options = num_neighbors_options + [
+    {'label': str(i), 'value': str(i)} for i in (30, 40, 50, 75, 100, 150, 200, 300, 400, max_embedding_neighbors)]
+
+visualization_options = [
+    {'label': 'Overall Cluster [Visualize all companies in a grouping]', 'value': 'OVERALL'},
+    {'label': 'Kernel(s) [Pick at least one company, and see all companies that are classified in same grouping]', 'value': 'MULTI-KERNEL'},
+    {'label': 'Nearest Neighbors [Pick one company, and see up to 20 companies that are very similar but not necessarily classified in same grouping]', 'value': 'NEAREST NEIGHBORS'},
+    {'label': 'Nearest in Map [Pick at least one company, and see up to 500 companies closest to it in the 2D/3D map]', 'value': 'EMBEDDING NEIGHBORS'},
+    {'label': 'Trajectory [Pick at least one company, and follow it through every year]', 'value': 'TRAJECTORY'},
+    {'label': 'Biggest Movers [See which companies\' nearest neighbors changed most since the year before]', 'value': 'BIGGEST MOVERS'},
+    {'label': 'Cluster Centroids [See one point per group at its center, sized by its number of companies]', 'value': 'CENTROIDS'}
+]
+
+# assets/clientside.js draws the OVERALL, Kernel(s), Nearest Neighbors and
+# Nearest in Map views only; the others are not offered in that mode.
+server_only_views = {'TRAJECTORY', 'BIGGEST MOVERS', 'CENTROIDS'}
+if clientside_figures:
+    visualization_options = [option for option in visualization_options if option['value'] not in server_only_views]
+
 app.layout = html.Div([
 
     html.Div([
@@ -1028,11 +1210,7 @@ app.layout = html.Div([
     html.Div([
         dcc.Dropdown(
             id='visualization_model',
-            options=[
-                {'label': 'Overall Cluster [Visualize all companies in a grouping]', 'value': 'OVERALL'},
-                {'label': 'Kernel(s) [Pick at least one company, and see all companies that are classified in same grouping]', 'value': 'MULTI-KERNEL'},
-                {'label': 'Nearest Neighbors [Pick one company, and see up to 20 companies that are very similar but not necessarily classified in same grouping]', 'value': 'NEAREST NEIGHBORS'}
-            ],
+            options=visualization_options,
             placeholder='Visualization Model'
         ),
 
@@ -1051,15 +1229,7 @@ app.layout = html.Div([
 
         dcc.Dropdown(
             id='year',
-            options=[
-                {'label': '2014', 'value': '2013'},
-                {'label': '2015', 'value': '2014'},
-                {'label': '2016', 'value': '2015'},
-                {'label': '2017', 'value': '2016'},
-                {'label': '2018', 'value': '2017'},
-                {'label': '2019', 'value': '2018'},
-                {'label': '2020', 'value': '2019'}
-            ],
+            options=[{'label': label, 'value': yr} for yr, label in year_labels.items()],
             placeholder='Year'
         ), 
 
@@ -1074,7 +1244,7 @@ app.layout = html.Div([
         dcc.Dropdown(
             id='num_neighbors',
             options=num_neighbors_options,
-            placeholder='Number of Neighbors (Pick [1-20])',
+            placeholder='Number of Neighbors',
             multi=False,
             disabled=True,
             value="1"
@@ -1095,9 +1265,51 @@ app.layout = html.Div([
         dcc.Graph(
             id='graph',
             figure={}
+        ),
+        dcc.Store(id='year_data'),
+        dcc.Store(id='graph_state')
+    ]),
+
+    html.Div(id='movers', style={'display': 'none'}, children=[
+        dash_table.DataTable(
+            id='movers_table',
+            columns=[
+                {'name': 'Company', 'id': 'Name'},
+                {'name': 'Group', 'id': 'Group'},
+                {'name': 'Neighbors Kept (Rank-weighted)', 'id': 'overlap', 'type': 'numeric'},
+                {'name': 'Jaccard', 'id': 'jaccard', 'type': 'numeric'},
+                {'name': 'Shared Neighbors', 'id': 'shared', 'type': 'numeric'}
+            ],
+            data=[],
+            sort_action='native',
+            filter_action='native',
+            page_size=20
         )
     ]),
 
+    html.Div(id='selection', style={'display': 'none'}, children=[
+        html.P(id='selection_summary'),
+        html.Button('Show as Kernels', id='selection_kernels', n_clicks=0),
+        html.Div([
+            dash_table.DataTable(
+                id='selection_ml_table',
+                columns=[{'name': 'ML Group', 'id': 'Group'}, {'name': 'Companies', 'id': 'Companies', 'type': 'numeric'}],
+                data=[],
+                sort_action='native',
+                page_size=10
+            )
+        ], style={'display': 'inline-block', 'width': '48%', 'verticalAlign': 'top'}),
+        html.Div([
+            dash_table.DataTable(
+                id='selection_gics_table',
+                columns=[{'name': 'GICS Group', 'id': 'Group'}, {'name': 'Companies', 'id': 'Companies', 'type': 'numeric'}],
+                data=[],
+                sort_action='native',
+                page_size=10
+            )
+        ], style={'display': 'inline-block', 'width': '48%', 'marginLeft': '4%', 'verticalAlign': 'top'})
+    ]),
+
     html.Div([
         html.P('© 2021 by MIT LFE. All Rights Reserved.'),
         html.P('The Global Industry Classification Standard (“GICS”) was developed by and is the exclusive property and a service mark of MSCI Inc. (“MSCI”) and S&P Global Market Intelligence (“S&P”) and is licensed for use by [Licensee]. Neither MSCI, S&P, nor any other party involved in making or compiling the GICS or any GICS classifications makes any express or implied warranties or representations with respect to such standard or classification (or the results to be obtained by the use thereof), and all such parties hereby expressly disclaim all warranties of originality, accuracy, completeness, merchantability and fitness for a particular purpose with respect to any of such standard or classification. Without limiting any of the foregoing, in no event shall MSCI, S&P, any of their affiliates or any third party involved in making or compiling the GICS or any GICS classifications have any liability for any direct, indirect, special, punitive, consequential or any other damages (including lost profits) even if notified of the possibility of such damages.'),
@@ -1112,7 +1324,7 @@ app.layout = html.Div([
     dash.dependencies.Output('year', 'disabled'),
     dash.dependencies.Input('visualization_model', 'value'))
 def update_disabled(visualization_model):
-    return (visualization_model not in {'MULTI-KERNEL', 'NEAREST NEIGHBORS'}), (visualization_model not in {'MULTI-KERNEL', 'OVERALL', 'NEAREST NEIGHBORS'}), (visualization_model not in {'MULTI-KERNEL', 'OVERALL', 'NEAREST NEIGHBORS'})
+    return (visualization_model not in {'MULTI-KERNEL', 'NEAREST NEIGHBORS', 'EMBEDDING NEIGHBORS', 'TRAJECTORY'}), (visualization_model not in {'MULTI-KERNEL', 'OVERALL', 'NEAREST NEIGHBORS', 'EMBEDDING NEIGHBORS', 'TRAJECTORY', 'BIGGEST MOVERS', 'CENTROIDS'}), (visualization_model not in {'MULTI-KERNEL', 'OVERALL', 'NEAREST NEIGHBORS', 'EMBEDDING NEIGHBORS', 'TRAJECTORY', 'BIGGEST MOVERS', 'CENTROIDS'})
 
 @app.callback(
     dash.dependencies.Output('companies', 'placeholder'),
@@ -1129,19 +1341,32 @@ def update_companies_dropdown(vis_model):
     [dash.dependencies.Input('companies', 'disabled'),
     dash.dependencies.Input('cluster_group', 'disabled'),
     dash.dependencies.Input('year', 'disabled'),
-    dash.dependencies.Input('year', 'value')])
-def get_companies(comps_disabled, cluster_grp_disabled, yr_disabled, yr):
+    dash.dependencies.Input('year', 'value'),
+    dash.dependencies.Input('companies', 'search_value')],
+    [dash.dependencies.State('companies', 'value')])
+def get_companies(comps_disabled, cluster_grp_disabled, yr_disabled, yr, search_value=None, selected=None):
+    # Only the best matches for what is typed go to the browser, plus the
+    # selected companies so the dropdown keeps showing them.
     new_options = []
     if not comps_disabled and not cluster_grp_disabled and not yr_disabled and not (yr is None):
-        check_df = yr_df_dict[yr]
-        for comp in sorted(check_df.Name):
-            new_options.append({'label': comp, 'value': comp})
+        search = yr_search_dict[yr]
+        selected = [selected] if isinstance(selected, str) else list(selected or [])
+        idx = yr_idx_dict[yr]
+        for comp in dict.fromkeys([c for c in selected if c in idx] + search.search(search_value or '', limit=search_limit)):
+            option = {'label': comp, 'value': comp}
+            if dropdown_search:
+                # The dropdown filters options again in the browser; this
+                # keeps SID and typo matches from being hidden.
+                option['search'] = ' '.join([comp, search.sid_text(comp), search_value or ''])
+            new_options.append(option)
     return new_options
 
 @app.callback(
     dash.dependencies.Output('num_neighbors', 'options'),
     dash.dependencies.Input('visualization_model', 'value'))
 def get_num_neighbors(vis_model):
+    if vis_model == 'EMBEDDING NEIGHBORS':
+        return embedding_neighbors_options
     return [] if vis_model != 'NEAREST NEIGHBORS' else num_neighbors_options
 
 @app.callback(
@@ -1149,19 +1374,284 @@ def get_num_neighbors(vis_model):
     dash.dependencies.Input('visualization_model', 'value'),
     dash.dependencies.Input('companies', 'value'))
 def get_num_neighbors(vis_model, comp_selected):
-    return vis_model != "NEAREST NEIGHBORS" 
+    return vis_model not in {"NEAREST NEIGHBORS", "EMBEDDING NEIGHBORS"}
 
 @app.callback(
-    dash.dependencies.Output('graph', 'figure'),
+    dash.dependencies.Output('movers_table', 'data'),
+    dash.dependencies.Output('movers', 'style'),
+    dash.dependencies.Input('visualization_model', 'value'),
+    dash.dependencies.Input('cluster_group', 'value'),
+    dash.dependencies.Input('year', 'value'))
+def update_movers(vis_model, cluster_group, yr):
+    if vis_model != 'BIGGEST MOVERS' or cluster_group is None or yr is None:
+        return [], {'display': 'none'}
+    records = drift.biggest_movers(neighbor_drift(), yr)
+    idx = yr_idx_dict[yr]
+    rows = [idx.sid_rows[sid] for sid in records['sid'].tolist()]
+    df = yr_df_dict[yr]
+    return [{'Name': name, 'Group': group, 'overlap': round(overlap, 3), 'jaccard': round(jaccard, 3), 'shared': shared}
+            for name, group, overlap, jaccard, shared in zip(df['Name'].to_numpy()[rows].tolist(), df[cluster_group].to_numpy()[rows].tolist(),
+                                                             records['overlap'].tolist(), records['jaccard'].tolist(),
+                                                             records['shared'].tolist())], {}
+
+def selected_rows(selected, vis_model, yr, dims):
+    # Box and lasso selections are resolved on 2D maps that draw every company.
+    if vis_model not in {'OVERALL', 'BIGGEST MOVERS'} or str(dims) != '2' or yr is None:
+        return None
+    return selection.region_rows(yr_space_dict[yr][2], selected)
+
+@app.callback(
+    dash.dependencies.Output('selection_summary', 'children'),
+    dash.dependencies.Output('selection_ml_table', 'data'),
+    dash.dependencies.Output('selection_gics_table', 'data'),
+    dash.dependencies.Output('selection', 'style'),
+    dash.dependencies.Input('graph', 'selectedData'),
+    dash.dependencies.Input('visualization_model', 'value'),
+    dash.dependencies.Input('cluster_group', 'value'),
+    dash.dependencies.Input('year', 'value'),
+    dash.dependencies.Input('dimension_toggle', 'value'))
+def update_selection(selected, vis_model, cluster_group, yr, dims):
+    # A selection belongs to the figure it was drawn on: any other change hides it.
+    triggered = {t['prop_id'].split('.')[0] for t in dash.callback_context.triggered}
+    rows = selected_rows(selected, vis_model, yr, dims) if triggered == {'graph'} and cluster_group else None
+    if rows is None:
+        return '', [], [], {'display': 'none'}
+    info = selection.summary(yr_df_dict[yr], yr_idx_dict[yr], yr_space_dict[yr][2], rows, cluster_group)
+    if not info['count']:
+        return 'No companies selected.', [], [], {}
+    text = '%d companies selected, mean position (%.2f, %.2f). Companies per ML and GICS %s:' % (
+        info['count'], info['mean'][0], info['mean'][1], info['level'])
+    return text, info['ml'], info['gics'], {}
+
+@app.callback(
+    dash.dependencies.Output('visualization_model', 'value'),
+    dash.dependencies.Output('companies', 'value'),
+    dash.dependencies.Input('selection_kernels', 'n_clicks'),
+    dash.dependencies.State('graph', 'selectedData'),
+    dash.dependencies.State('visualization_model', 'value'),
+    dash.dependencies.State('year', 'value'),
+    dash.dependencies.State('dimension_toggle', 'value'))
+def selection_to_kernels(n_clicks, selected, vis_model, yr, dims):
+    rows = selected_rows(selected, vis_model, yr, dims) if n_clicks else None
+    if rows is None or not len(rows):
+        raise dash.exceptions.PreventUpdate
+    names = yr_df_dict[yr]['Name'].to_numpy(dtype=object)[rows].tolist()
+    # Share classes repeat a name; companies without one cannot be picked.
+    return 'MULTI-KERNEL', list(dict.fromkeys(name for name in names if isinstance(name, str)))
+
+def update_graph(vis_model, cluster_group, yr, comps_selected, dims, n_neighbors, graph_state=None, relayout=None):
+    key = figure_key(vis_model, cluster_group, yr, comps_selected, dims, n_neighbors)
+    labels = {'vis_type': vis_model, 'year': yr, 'dims': dims}
+    triggered = {t['prop_id'].split('.')[0] for t in dash.callback_context.triggered} if relayout or graph_state else set()
+    if triggered == {'graph'}:
+        # Zooming only matters to a level-of-detail OVERALL view in 2D: a
+        # zoomed viewport is drawn from the spatial index, zooming back out
+        # gets the usual (aggregated) figure.
+        view = lod.viewport(relayout) if lod_points and vis_model == 'OVERALL' and str(dims) == '2' and yr else lod.UNCHANGED
+        if view is lod.UNCHANGED:
+            raise dash.exceptions.PreventUpdate
+        if view is not None:
+            metrics.graph_requests.inc(source='viewport', **labels)
+            return raw_json.embed(figure_json(render_figure(vis_model, cluster_group, yr, [], dims, 1, viewport=view))), graph_state_for(key)
+    if graph_state and Patch is not None and not figure_options['compact']:
+        # Only a change of companies or neighbor count can be applied to
+        # the figure already on screen; anything else rebuilds it.
+        if triggered <= {'companies', 'num_neighbors'}:
+            patched = patch_graph(graph_state, key)
+            if patched is not None:
+                metrics.graph_requests.inc(source='patch', **labels)
+                return patched
+    try:
+        data, source = cached_figure(key)
+    except UnknownCompanyError as e:
+        # Companies picked in another year stay selected when the year
+        # changes; say which one is missing instead of failing.
+        metrics.graph_requests.inc(source='unknown company', **labels)
+        return unknown_company_figure(e), None
+    metrics.graph_requests.inc(source=source, **labels)
+    return raw_json.embed(data), graph_state_for(key)
+
+def unknown_company_figure(error):
+    fig = apply_layout(go.Figure())
+    fig.add_annotation(text='%s is not in %s' % (error.company, error.year), xref='paper', yref='paper', x=0.5, y=0.5,
+                       showarrow=False, font=dict(size=16))
+    fig.update_xaxes(visible=False)
+    fig.update_yaxes(visible=False)
+    return fig.to_plotly_json()
+
+def cached_figure(key):
+    """``(figure JSON bytes, source)`` for a ``figure_key``: from the cache, a pre-rendered file, or rendered now."""
+    data = figure_cache.get(key)
+    source = 'cache'
+    if data is None:
+        vis_model, cluster_group, yr, companies, dims, n_neighbors = key
+        if vis_model == 'OVERALL' and not lod_points:
+            data = load_prerendered(yr, cluster_group, str(dims), options=figure_options)
+            source = 'prerendered'
+        if data is None:
+            # NEAREST NEIGHBORS takes one company, the other views a list.
+            companies = companies[0] if vis_model == 'NEAREST NEIGHBORS' else list(companies)
+            data = figure_json(render_figure(vis_model, cluster_group, yr, companies, dims, n_neighbors or 1))
+            source = 'rendered'
+        figure_cache.put(key, data)
+    return data, source
+
+def graph_state_for(key, groups=None):
+    # What the client is showing: the figure key and, for MULTI-KERNEL,
+    # the group value drawn by each trace in trace order.
+    vis_model, cluster_group, yr, companies, dims, n_neighbors = key
+    if groups is None and vis_model == 'MULTI-KERNEL' and companies:
+        idx = yr_idx_dict[yr]
+        groups = np.unique(idx.group_values[cluster_group][idx.group_codes[cluster_group][idx.rows(companies)]]).tolist()
+    return {'key': [vis_model, cluster_group, yr, list(companies), dims, n_neighbors], 'groups': groups}
+
+def patch_graph(graph_state, key):
+    """Return ``(Patch, graph_state)`` turning the figure of ``graph_state`` into that of ``key``, or None."""
+    vis_model, cluster_group, yr, companies, dims, n_neighbors = key
+    old_vis, old_grp, old_yr, old_companies, old_dims, old_neighbors = graph_state['key']
+    if (vis_model, cluster_group, yr, dims) != (old_vis, old_grp, old_yr, old_dims) or not companies \
+            or not all(c in yr_idx_dict[yr] for c in list(companies) + list(old_companies)):
+        # update_graph reports companies missing from the year.
+        return None
+    df = yr_df_dict[yr]
+    patch = Patch()
+
+    if vis_model == 'NEAREST NEIGHBORS':
+        if list(companies) != old_companies:
+            return None
+        fig = generate_vis(df, year=int(yr), dim=dims, vis_type=vis_model, grp=cluster_group, num_neighbors=n_neighbors, companies=companies[0], size=8)
+        patch['data'][0] = fig.data[0].to_plotly_json()
+        return patch, graph_state_for(key)
+
+    if vis_model != 'MULTI-KERNEL' or not graph_state.get('groups'):
+        return None
+    idx = yr_idx_dict[yr]
+    values = idx.group_values[cluster_group][idx.group_codes[cluster_group]]
+    new_rows = {c: idx.row(c) for c in companies}
+    highlighted = set(new_rows.values())
+    new_groups = set(values[list(highlighted)].tolist())
+    old_groups = graph_state['groups']
+    groups = [g for g in old_groups if g in new_groups]
+
+    # Delete from the back so the remaining trace indices stay valid.
+    for t in reversed(range(len(old_groups))):
+        if old_groups[t] not in new_groups:
+            del patch['data'][t]
+
+    # Recolor companies that were (de)selected inside groups still drawn.
+    changed = {idx.row(c) for c in set(old_companies) ^ set(companies)}
+    for row in changed:
+        if values[row] not in groups:
+            continue
+        members = idx.group_rows(cluster_group, values[row])
+        pos = int(np.searchsorted(members, row))
+        color = '#000000' if row in highlighted else df[cluster_group + '_Color'].iat[row]
+        patch['data'][groups.index(values[row])]['marker']['color'][pos] = color
+
+    for g in sorted(new_groups - set(groups)):
+        in_group = [c for c, row in new_rows.items() if values[row] == g]
+        fig = generate_vis(df, year=int(yr), dim=dims, vis_type=vis_model, grp=cluster_group, companies=in_group, size=8)
+        patch['data'].append(fig.data[0].to_plotly_json())
+        groups.append(g)
+    return patch, graph_state_for(key, groups)
+
+def render_figure(vis_model, cluster_group, yr, comps_selected, dims, n_neighbors, viewport=None):
+    df = yr_df_dict[yr]
+    return generate_vis(df, year=int(yr), dim=int(dims), vis_type=vis_model, grp=cluster_group, num_neighbors=int(n_neighbors), companies=comps_selected, size=8, viewport=viewport, **figure_options)
+
+# Getting a figure's JSON, from Plotly objects or a pre-rendered file, is
+# the 'serialize' stage of /metrics.
+@stage('serialize')
+def figure_json(fig):
+    return encode(fig.to_plotly_json())
+
+load_prerendered = stage('serialize')(prerender.load_bytes)
+
+def figure_key(vis_model, cluster_group, yr, comps_selected, dims, n_neighbors):
+    # Drop inputs the view ignores so e.g. OVERALL hits no matter which
+    # companies are still selected in the dropdown.
+    if comps_selected is None or vis_model in {'OVERALL', 'BIGGEST MOVERS', 'CENTROIDS'}:
+        companies = ()
+    elif isinstance(comps_selected, str):
+        companies = (comps_selected,)
+    elif vis_model == 'NEAREST NEIGHBORS':
+        # Only the anchor, the first company picked, is drawn.
+        companies = tuple(comps_selected[:1])
+    else:
+        # Order doesn't change these views.
+        companies = tuple(sorted(set(comps_selected)))
+    n_neighbors = int(n_neighbors) if vis_model in {'NEAREST NEIGHBORS', 'EMBEDDING NEIGHBORS'} else None
+    return (vis_model, cluster_group, str(yr), companies, int(dims), n_neighbors)
+
+def get_year_data(yr):
+    if yr is None:
+        raise dash.exceptions.PreventUpdate
+    return yr_client_dict[yr]
+
+graph_inputs = [
     dash.dependencies.Input('visualization_model', 'value'),
     dash.dependencies.Input('cluster_group', 'value'),
     dash.dependencies.Input('year', 'value'),
     dash.dependencies.Input('companies', 'value'),
     dash.dependencies.Input('dimension_toggle', 'value'),
-    dash.dependencies.Input('num_neighbors', 'value'))
-def update_graph(vis_model, cluster_group, yr, comps_selected, dims, n_neighbors):
-    df = yr_df_dict[yr]
-    return generate_vis(df, year=int(yr), dim=int(dims), vis_type=vis_model, grp=cluster_group, num_neighbors=int(n_neighbors), companies=comps_selected, size=8)
+    dash.dependencies.Input('num_neighbors', 'value')]
+
+if clientside_figures:
+    app.callback(dash.dependencies.Output('year_data', 'data'),
+                 dash.dependencies.Input('year', 'value'))(get_year_data)
+    app.clientside_callback(ClientsideFunction(namespace='figures', function_name='render'),
+                            dash.dependencies.Output('graph', 'figure'),
+                            graph_inputs + [dash.dependencies.Input('year_data', 'data')])
+elif lod_points:
+    # Zooms only reach the server when they can change the figure.  Dash
+    # passes the relayoutData Input before the graph_state State.
+    def update_zoomable_graph(vis_model, cluster_group, yr, comps_selected, dims, n_neighbors, relayout=None, graph_state=None):
+        return update_graph(vis_model, cluster_group, yr, comps_selected, dims, n_neighbors, graph_state, relayout)
+    app.callback([dash.dependencies.Output('graph', 'figure'), dash.dependencies.Output('graph_state', 'data')],
+                 graph_inputs + [dash.dependencies.Input('graph', 'relayoutData')],
+                 [dash.dependencies.State('graph_state', 'data')])(metrics.staged(update_zoomable_graph, name='update_graph'))
+else:
+    app.callback([dash.dependencies.Output('graph', 'figure'), dash.dependencies.Output('graph_state', 'data')],
+                 graph_inputs,
+                 [dash.dependencies.State('graph_state', 'data')])(metrics.staged(update_graph, name='update_graph'))
+
+metrics.init_app(server, year_dicts={'cons_data1': yr_df_dict, 'd_matrix': yr_dm_dict, 'neighbors': yr_nn_dict,
+                                     'index': yr_idx_dict, 'spatial': yr_space_dict, 'centroids': yr_centroid_dict},
+                 figure_cache=figure_cache)
+profiler.init_app(server)
+drift.init_app(server, neighbor_drift, company_names)
+company_api.init_app(server, yr_df_dict, yr_idx_dict, yr_nn_dict, yr_space_dict)
+export.init_app(server, yr_df_dict, yr_idx_dict, view_rows)
+centroids.init_app(server, lambda yr, grp: yr_centroid_dict[yr][grp],
+                   lambda yr, grp, groups: group_labels(yr_df_dict[yr], yr_idx_dict[yr], grp, np.searchsorted(yr_idx_dict[yr].group_values[grp], groups)))
+
+# The figure of any view by GET, with the same parameters as /api/export;
+# identical figures get identical ETags (see compression.py).
+@server.route('/api/figure')
+def figure_route():
+    args = flask.request.args
+    vis_model = args.get('vis_model', 'OVERALL')
+    cluster_group = args.get('cluster_group', 'GICS_SECTOR')
+    yr = args.get('yr')
+    companies = args.getlist('comps_selected')
+    dims, n_neighbors = args.get('dims', '2'), args.get('n_neighbors', '1')
+    if vis_model not in {'OVERALL', 'BIGGEST MOVERS', 'CENTROIDS', 'MULTI-KERNEL', 'NEAREST NEIGHBORS', 'EMBEDDING NEIGHBORS', 'TRAJECTORY'} \
+            or cluster_group not in GROUP_COLUMNS or dims not in ('2', '3') or not n_neighbors.isdigit() \
+            or (vis_model not in {'OVERALL', 'BIGGEST MOVERS', 'CENTROIDS'} and not companies):
+        flask.abort(400)
+    if yr not in YEARS:
+        flask.abort(404)
+    try:
+        data, source = cached_figure(figure_key(vis_model, cluster_group, yr, companies, dims, n_neighbors))
+    except UnknownCompanyError as e:
+        flask.abort(404, str(e))
+    return flask.Response(data, mimetype='application/json')
+
+# Last, so it runs first among the after_request hooks and the metrics see
+# the compressed size; only the figure JSON spliced into update_graph
+# responses has to come before it.
+compression.init_app(server)
+raw_json.init_app(server)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,190 @@
+// Client-side rendering of the graph (CLIENTSIDE_FIGURES=1).
+//
+// The server sends each year's coordinates, group codes and neighbor matrix
+// once into the `year_data` store (see payload.client_year_data); this
+// function rebuilds the same figure update_graph would return, without a
+// round trip per dropdown change.
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    figures: {
+        render: (function () {
+            var cached = {data: null, rows: null};
+
+            function nameRows(data) {
+                // First row wins for repeated names, like YearIndex.
+                if (cached.data !== data) {
+                    var rows = {};
+                    for (var i = data.names.length - 1; i >= 0; i--) {
+                        rows[data.names[i]] = i;
+                    }
+                    cached = {data: data, rows: rows};
+                }
+                return cached.rows;
+            }
+
+            function pick(values, rows) {
+                var out = new Array(rows.length);
+                for (var i = 0; i < rows.length; i++) {
+                    out[i] = values[rows[i]];
+                }
+                return out;
+            }
+
+            return function (vis_model, grp, yr, companies, dims, n_neighbors, data) {
+                var no_update = window.dash_clientside.no_update;
+                if (!data || data.year !== yr || !vis_model || !data.hover_families[grp]) {
+                    return no_update;
+                }
+                var byName = nameRows(data);
+                var n = data.names.length;
+                var rows = [];
+                var highlight = [];
+                var i;
+
+                if (vis_model === 'OVERALL') {
+                    for (i = 0; i < n; i++) {
+                        rows.push(i);
+                    }
+                } else if (vis_model === 'MULTI-KERNEL') {
+                    var selected = [].concat(companies || []);
+                    var codes = data.groups[grp].codes;
+                    var wanted = {};
+                    for (i = 0; i < selected.length; i++) {
+                        if (!(selected[i] in byName)) {
+                            return no_update;
+                        }
+                        highlight.push(byName[selected[i]]);
+                        wanted[codes[byName[selected[i]]]] = true;
+                    }
+                    if (!highlight.length) {
+                        return no_update;
+                    }
+                    for (i = 0; i < n; i++) {
+                        if (wanted[codes[i]]) {
+                            rows.push(i);
+                        }
+                    }
+                } else if (vis_model === 'NEAREST NEIGHBORS') {
+                    var company = Array.isArray(companies) ? companies[0] : companies;
+                    if (!(company in byName)) {
+                        return no_update;
+                    }
+                    var neighbors = data.neighbors[byName[company]];
+                    var k = parseInt(n_neighbors, 10) + 1;
+                    for (i = 0; i < neighbors.length && i < k; i++) {
+                        if (neighbors[i] >= 0) {
+                            rows.push(neighbors[i]);
+                        }
+                    }
+                    highlight.push(rows[0]);
+                } else if (vis_model === 'EMBEDDING NEIGHBORS') {
+                    // Brute force over the year's unrounded points, like
+                    // spatial.py without SciPy: nearest first, ties broken
+                    // by row.
+                    var chosen = [].concat(companies || []);
+                    var kk = parseInt(n_neighbors, 10);
+                    var seen = {};
+                    var axesE = dims === '2' ? ['X', 'Y'] : ['X', 'Y', 'Z'];
+                    var cols = axesE.map(function (axis) { return data.coords[axis + dims + 'TSNE']; });
+                    var lists = [];
+                    for (i = 0; i < chosen.length; i++) {
+                        if (!(chosen[i] in byName)) {
+                            return no_update;
+                        }
+                        var anchor = byName[chosen[i]];
+                        var order = [];
+                        for (var j = 0; j < n; j++) {
+                            if (j === anchor) {
+                                continue;
+                            }
+                            var d2 = 0;
+                            for (var a = 0; a < cols.length; a++) {
+                                d2 += (cols[a][j] - cols[a][anchor]) * (cols[a][j] - cols[a][anchor]);
+                            }
+                            order.push([d2, j]);
+                        }
+                        order.sort(function (p, q) { return p[0] - q[0] || p[1] - q[1]; });
+                        lists.push(order.slice(0, kk).map(function (p) { return p[1]; }));
+                        if (!seen[anchor]) {
+                            seen[anchor] = true;
+                            rows.push(anchor);
+                            highlight.push(anchor);
+                        }
+                    }
+                    if (!highlight.length) {
+                        return no_update;
+                    }
+                    lists.forEach(function (list) {
+                        list.forEach(function (r) {
+                            if (!seen[r]) {
+                                seen[r] = true;
+                                rows.push(r);
+                            }
+                        });
+                    });
+                } else {
+                    return no_update;
+                }
+
+                var group = data.groups[grp];
+                var colors = pick(group.colors, rows).map(function (c) { return group.palette[c]; });
+                for (i = 0; i < rows.length; i++) {
+                    if (highlight.indexOf(rows[i]) >= 0) {
+                        colors[i] = '#000000';
+                    }
+                }
+                // Hover families and titles come from indexes.HOVER_FAMILIES.
+                var hover = data.hover[data.hover_families[grp]];
+                var names = pick(data.names, rows);
+                var hovertext = rows.map(function (r, j) {
+                    return names[j] + ' (GICS ' + hover.title + ': ' + hover.labels[hover.codes[r]] + ')';
+                });
+
+                var trace = {
+                    type: dims === '2' ? 'scatter' : 'scatter3d',
+                    mode: 'markers',
+                    marker: {size: 8, opacity: 0.8, color: colors},
+                    hovertext: hovertext,
+                    hovertemplate: '%{hovertext}<extra></extra>'
+                };
+                var axes = dims === '2' ? ['X', 'Y'] : ['X', 'Y', 'Z'];
+                axes.forEach(function (axis) {
+                    trace[axis.toLowerCase()] = pick(data.coords[axis + dims + 'TSNE'], rows);
+                });
+                if (vis_model === 'OVERALL' && dims === '2') {
+                    trace.text = names;
+                    trace.hoverinfo = 'text';
+                }
+                if (vis_model === 'MULTI-KERNEL') {
+                    // One trace per group, in group order, like
+                    // make_figure(..., split=grp) on the server.
+                    var groupCodes = data.groups[grp].codes;
+                    var present = [];
+                    for (i = 0; i < rows.length; i++) {
+                        if (present.indexOf(groupCodes[rows[i]]) < 0) {
+                            present.push(groupCodes[rows[i]]);
+                        }
+                    }
+                    present.sort(function (p, q) { return p - q; });
+                    var traces = present.map(function (code) {
+                        var sel = [];
+                        for (var r = 0; r < rows.length; r++) {
+                            if (groupCodes[rows[r]] === code) {
+                                sel.push(r);
+                            }
+                        }
+                        var part = Object.assign({}, trace, {
+                            marker: Object.assign({}, trace.marker, {color: pick(colors, sel)}),
+                            hovertext: pick(hovertext, sel)
+                        });
+                        axes.forEach(function (axis) {
+                            part[axis.toLowerCase()] = pick(trace[axis.toLowerCase()], sel);
+                        });
+                        return part;
+                    });
+                    return {data: traces, layout: Object.assign({}, data.layout, {showlegend: false})};
+                }
+                return {data: [trace], layout: data.layout};
+            };
+        })()
+    }
+});
@@ -0,0 +1,101 @@
+"""Centroid and dispersion of every group, per year and grouping column.
+
+For each group of a grouping column (``ML_sector`` ... ``GICS_SUB_INDUSTRY``)
+and each TSNE embedding (2D and 3D):
+
+* ``centroid<dim>``: the members' mean position;
+* ``mean_dist<dim>`` / ``max_dist<dim>``: mean and largest distance of a
+  member to that centroid, so tight clusters have small values;
+* ``nearest<dim>`` / ``nearest_dist<dim>``: the closest other group of the
+  same column, by centroid distance (-1 / NaN if there is none);
+
+plus ``members``, the group's company count.  A year and column is a few
+bincounts over the group codes of ``indexes.YearIndex`` and one nearest
+neighbor query over the centroids, cached in ``.data_cache/`` until the
+year's ``cons_data1`` changes.  ``init_app`` serves the records as JSON at
+``/api/centroids``.
+"""
+import flask
+import numpy as np
+
+from data_store import YEARS, csv_path, load_array
+from indexes import GROUP_COLUMNS
+from spatial import EmbeddingIndex
+
+
+CENTROID_DTYPE = np.dtype([('group', np.int64), ('members', np.int32),
+                           ('centroid2', np.float64, (2,)), ('mean_dist2', np.float32), ('max_dist2', np.float32),
+                           ('nearest2', np.int64), ('nearest_dist2', np.float32),
+                           ('centroid3', np.float64, (3,)), ('mean_dist3', np.float32), ('max_dist3', np.float32),
+                           ('nearest3', np.int64), ('nearest_dist3', np.float32)])
+
+
+def group_centroids(df, idx, grp, method='TSNE'):
+    """Structured array (``CENTROID_DTYPE``) with one record per ``grp`` group, in group value order."""
+    codes = idx.group_codes[grp]
+    values = idx.group_values[grp]
+    members = np.bincount(codes, minlength=len(values))
+    # Members of each group are contiguous in this order, for the maxima.
+    order = np.argsort(codes, kind='stable')
+    starts = np.cumsum(members) - members
+
+    out = np.zeros(len(values), dtype=CENTROID_DTYPE)
+    out['group'] = values
+    out['members'] = members
+    for dim in (2, 3):
+        points = df[[axis + str(dim) + method for axis in 'XYZ'[:dim]]].to_numpy(dtype=np.float64)
+        centroids = np.stack([np.bincount(codes, points[:, a], minlength=len(values)) for a in range(dim)], axis=1) / members[:, None]
+        dist = np.sqrt(np.sum((points - centroids[codes]) ** 2, axis=1))
+        out['centroid%d' % dim] = centroids
+        out['mean_dist%d' % dim] = np.bincount(codes, dist, minlength=len(values)) / members
+        out['max_dist%d' % dim] = np.maximum.reduceat(dist[order], starts)
+
+        nearest = EmbeddingIndex(centroids).neighbor_rows(np.arange(len(values)), 1)
+        if nearest.shape[1] > 1:
+            out['nearest%d' % dim] = values[nearest[:, 1]]
+            out['nearest_dist%d' % dim] = np.sqrt(np.sum((centroids - centroids[nearest[:, 1]]) ** 2, axis=1))
+        else:
+            out['nearest%d' % dim] = -1
+            out['nearest_dist%d' % dim] = np.nan
+    return out
+
+
+def load_centroids(year, df_dict, idx_dict, grp):
+    return load_array('centroids_' + grp, year, [csv_path('cons_data1', year)],
+                      lambda: group_centroids(df_dict[year], idx_dict[year], grp))
+
+
+def init_app(server, stats, labels):
+    """Add the ``/api/centroids`` route.
+
+    ``stats(year, grp)`` returns the records of a year and grouping column
+    and ``labels(year, grp, groups)`` the display names of groups.  Query
+    parameters: ``year`` and ``grouping`` (required), and ``dims`` (``2``,
+    default, or ``3``).  ``mean_dist`` at the top level averages the groups'
+    mean distances to their centroids, weighted by members.
+    """
+    @server.route('/api/centroids')
+    def centroids_route():
+        args = flask.request.args
+        year, grp, dims = args.get('year'), args.get('grouping'), args.get('dims', '2')
+        if grp not in GROUP_COLUMNS or dims not in ('2', '3'):
+            flask.abort(400)
+        if year not in YEARS:
+            flask.abort(404)
+        data = stats(year, grp)
+        names = dict(zip(data['group'].tolist(), labels(year, grp, data['group'])))
+        records = []
+        for record in data:
+            nearest = int(record['nearest' + dims])
+            records.append({'group': int(record['group']), 'name': names[int(record['group'])], 'members': int(record['members']),
+                            'centroid': [round(v, 4) for v in record['centroid' + dims].tolist()],
+                            'mean_dist': round(float(record['mean_dist' + dims]), 4),
+                            'max_dist': round(float(record['max_dist' + dims]), 4),
+                            'nearest': nearest if nearest >= 0 else None,
+                            'nearest_name': names.get(nearest),
+                            'nearest_dist': round(float(record['nearest_dist' + dims]), 4) if nearest >= 0 else None})
+        # Member-weighted, so e.g. ML_subindustry and GICS_SUB_INDUSTRY compare directly.
+        mean_dist = float(np.average(data['mean_dist' + dims], weights=data['members']))
+        return flask.jsonify({'year': year, 'grouping': grp, 'dims': int(dims), 'mean_dist': round(mean_dist, 4), 'groups': records})
+
+    return server
@@ -0,0 +1,207 @@
+"""Batch company queries over HTTP, streamed as NDJSON.
+
+``init_app`` adds two routes.  Both take a JSON body on POST, or query
+parameters on GET, with repeated ``company``/``value`` parameters for lists:
+
+* ``/api/companies``: ``year`` and ``companies`` (names or SIDs).  Returns one
+  line per company with its SID, name, ML and GICS groups, 2D/3D coordinates
+  and nearest neighbors.  ``neighbors`` sets how many (default 20).  With
+  ``source=d_matrix`` (default) they come from ``d_matrix_<year>.csv`` (up to
+  20); with ``source=embedding`` they come from the 2D or 3D map (``dim``, up
+  to 500) and include distances.
+* ``/api/groups``: ``year``, ``grouping`` (e.g. ``ML_sector``) and the group
+  ``values`` and/or the ``companies`` whose groups to list.  Returns one line
+  per group with all its members.
+
+Lines follow the order of the request; a company or group that is not found
+gets a line with an ``error`` instead of failing the batch.  Companies are
+resolved through ``YearIndex`` and written ``CHUNK`` at a time, so the first
+lines arrive right away and memory does not grow with the batch.
+"""
+import json
+
+import flask
+import numpy as np
+
+from data_store import YEARS
+from indexes import GROUP_COLUMNS, HOVER_LABELS, UnknownCompanyError
+
+
+CHUNK = 256
+MAX_BATCH = 10000
+MAX_NEIGHBORS = {'d_matrix': 20, 'embedding': 500}
+
+
+def params():
+    """Request parameters from the JSON body or the query string, lists as lists."""
+    if flask.request.is_json:
+        body = flask.request.get_json(silent=True)
+        if not isinstance(body, dict):
+            flask.abort(400)
+        return body
+    args = flask.request.values
+    out = {key: args.get(key) for key in args}
+    for key, single in (('companies', 'company'), ('values', 'value')):
+        if single in args or key in args:
+            out[key] = args.getlist(single) + args.getlist(key)
+    return out
+
+
+def ndjson(lines):
+    def generate():
+        for chunk in lines:
+            yield ''.join(json.dumps(line, separators=(',', ':')) + '\n' for line in chunk)
+    return flask.Response(generate(), mimetype='application/x-ndjson')
+
+
+def chunks(items):
+    for start in range(0, len(items), CHUNK):
+        yield items[start:start + CHUNK]
+
+
+def resolve(idx, companies):
+    """``(rows, errors)`` for ``companies``: row -1 and an error message for unknown ones."""
+    rows = np.full(len(companies), -1, dtype=np.intp)
+    errors = {}
+    for i, company in enumerate(companies):
+        try:
+            rows[i] = idx.row(company)
+        except UnknownCompanyError as e:
+            errors[i] = str(e)
+    return rows, errors
+
+
+def company_records(df, rows):
+    """Per-row SID, name, groups, GICS labels and coordinates, one dict per row."""
+    columns = {col: df[col].to_numpy()[rows].tolist() for col in ['SID', 'Name'] + GROUP_COLUMNS}
+    labels = {col: df['Label_' + col].to_numpy()[rows].tolist() for col in HOVER_LABELS}
+    coords2 = df[['X2TSNE', 'Y2TSNE']].to_numpy()[rows].tolist()
+    coords3 = df[['X3TSNE', 'Y3TSNE', 'Z3TSNE']].to_numpy()[rows].tolist()
+    return [{'sid': columns['SID'][i], 'name': columns['Name'][i],
+             'groups': {grp: columns[grp][i] for grp in GROUP_COLUMNS},
+             'labels': {col: labels[col][i] for col in HOVER_LABELS},
+             'coords': {'2d': coords2[i], '3d': coords3[i]}}
+            for i in range(len(rows))]
+
+
+def init_app(server, df_dict, idx_dict, nn_dict, space_dict):
+    """Add the ``/api/companies`` and ``/api/groups`` routes over the per-year data dicts."""
+
+    def year_and_companies(p, required=True):
+        year = str(p.get('year', ''))
+        if year not in YEARS:
+            flask.abort(404 if year else 400)
+        companies = p.get('companies', [])
+        if isinstance(companies, (str, int)):
+            companies = [companies]
+        if not isinstance(companies, list) or len(companies) > MAX_BATCH or (required and not companies):
+            flask.abort(400)
+        return year, companies
+
+    @server.route('/api/companies', methods=['GET', 'POST'])
+    def companies_route():
+        p = params()
+        year, companies = year_and_companies(p)
+        source = p.get('source', 'd_matrix')
+        try:
+            k = int(p.get('neighbors', 20))
+            dim = int(p.get('dim', 2))
+        except (TypeError, ValueError):
+            flask.abort(400)
+        if source not in MAX_NEIGHBORS or not 0 <= k <= MAX_NEIGHBORS[source] or dim not in (2, 3):
+            flask.abort(400)
+        df, idx = df_dict[year], idx_dict[year]
+        sids = df['SID'].to_numpy()
+        names = df['Name'].to_numpy()
+        nn = nn_dict[year] if source == 'd_matrix' else None
+        space = space_dict[year][dim] if source == 'embedding' else None
+
+        def lines():
+            for batch in chunks(companies):
+                rows, errors = resolve(idx, batch)
+                found = rows[rows >= 0]
+                records = iter(company_records(df, found))
+                if nn is not None:
+                    neighbors, distances = nn[found, 1:k + 1], None
+                else:
+                    neighbors = space.neighbor_rows(found, k)[:, 1:]
+                    distances = np.linalg.norm(space.points[neighbors] - space.points[found][:, None, :], axis=2)
+                out = []
+                j = 0
+                for i, company in enumerate(batch):
+                    if i in errors:
+                        out.append({'query': company, 'year': year, 'error': errors[i]})
+                        continue
+                    row_neighbors = neighbors[j][neighbors[j] >= 0]
+                    record = dict(next(records), query=company, year=year)
+                    record['neighbors'] = [{'rank': rank + 1, 'sid': sid, 'name': name}
+                                           for rank, (sid, name) in enumerate(zip(sids[row_neighbors].tolist(),
+                                                                                  names[row_neighbors].tolist()))]
+                    if distances is not None:
+                        for entry, distance in zip(record['neighbors'], distances[j].tolist()):
+                            entry['distance'] = round(distance, 6)
+                    out.append(record)
+                    j += 1
+                yield out
+
+        return ndjson(lines())
+
+    @server.route('/api/groups', methods=['GET', 'POST'])
+    def groups_route():
+        p = params()
+        year, companies = year_and_companies(p, required=False)
+        grouping = p.get('grouping')
+        values = p.get('values', [])
+        if isinstance(values, (str, int)):
+            values = [values]
+        if grouping not in GROUP_COLUMNS or not isinstance(values, list) or len(values) > MAX_BATCH \
+                or not (values or companies):
+            flask.abort(400)
+        df, idx = df_dict[year], idx_dict[year]
+        group_values = idx.group_values[grouping]
+        sids = df['SID'].to_numpy()
+        names = df['Name'].to_numpy()
+
+        def lines():
+            # Requested values first, then the groups of the companies, each once.
+            seen = set()
+            for batch in chunks(values):
+                out = []
+                for value in batch:
+                    try:
+                        # Query strings carry group codes as text.
+                        members = idx.group_rows(grouping, group_values.dtype.type(value))
+                    except (TypeError, ValueError):
+                        members = ()
+                    if not len(members):
+                        out.append({'grouping': grouping, 'value': value, 'year': year, 'error': 'Unknown group'})
+                        continue
+                    key = group_values[idx.group_codes[grouping][members[0]]].item()
+                    seen.add(key)
+                    out.append(group_record(key, members))
+                yield out
+            for batch in chunks(companies):
+                rows, errors = resolve(idx, batch)
+                out = []
+                for i, company in enumerate(batch):
+                    if i in errors:
+                        out.append({'query': company, 'year': year, 'error': errors[i]})
+                        continue
+                    key = group_values[idx.group_codes[grouping][rows[i]]].item()
+                    if key in seen:
+                        continue
+                    seen.add(key)
+                    out.append(dict(group_record(key, idx.group_rows(grouping, key)), query=company))
+                yield out
+
+        def group_record(value, members):
+            record = {'grouping': grouping, 'value': value, 'year': year, 'size': len(members)}
+            if grouping in HOVER_LABELS:
+                record['label'] = df['Label_' + grouping].iat[members[0]]
+            record['members'] = [{'sid': sid, 'name': name}
+                                 for sid, name in zip(sids[members].tolist(), names[members].tolist())]
+            return record
+
+        return ndjson(lines())
+
+    return server
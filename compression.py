@@ -0,0 +1,96 @@
+"""Response compression and content-hash ETags.
+
+``init_app(server)`` post-processes every buffered response with a
+compressible type (JSON, HTML, CSS, JavaScript, text):
+
+* it gets a strong ``ETag``: a hash of the uncompressed body, with the
+  encoding appended for compressed variants.  A GET or HEAD whose
+  ``If-None-Match`` names that hash gets ``304 Not Modified``;
+* bodies of at least ``COMPRESS_MIN_SIZE`` bytes (default 1024) are sent with
+  brotli (``COMPRESS_BROTLI_QUALITY``, default 5; only if the ``brotli``
+  package is installed) or gzip (``COMPRESS_LEVEL``, default 6), whichever
+  the client accepts, preferring brotli.
+
+Compressed bodies are kept in an LRU cache keyed by the content hash and
+encoding, bounded by ``COMPRESS_CACHE_MB`` (default 32).  A figure served
+again, from ``figure_cache`` or a pre-rendered file, is sent without being
+compressed again.  Streamed responses (NDJSON, exports) are left alone.
+"""
+import gzip
+import hashlib
+import os
+
+import flask
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+from figure_cache import LRUCache
+
+
+LEVEL = int(os.environ.get('COMPRESS_LEVEL', 6))
+BROTLI_QUALITY = int(os.environ.get('COMPRESS_BROTLI_QUALITY', 5))
+MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', 1024))
+ENCODINGS = ['br', 'gzip'] if brotli is not None else ['gzip']
+MIMETYPES = {'application/json', 'application/javascript', 'text/javascript', 'text/html', 'text/css',
+             'text/plain', 'image/svg+xml'}
+
+variants = LRUCache(max_entries=1024, max_bytes=int(os.environ.get('COMPRESS_CACHE_MB', 32)) * 1024 * 1024)
+
+
+def content_hash(data):
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def compress(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    # mtime=0 keeps the output, and so the cache, deterministic.
+    return gzip.compress(data, compresslevel=LEVEL, mtime=0)
+
+
+def compressed(data, tag, encoding):
+    key = (tag, encoding)
+    body = variants.get(key)
+    if body is None:
+        body = compress(data, encoding)
+        variants.put(key, body, len(body))
+    return body
+
+
+def not_modified(tag):
+    """True if the request's ``If-None-Match`` names any variant of ``tag``."""
+    if flask.request.method not in ('GET', 'HEAD'):
+        return False
+    if_none_match = flask.request.if_none_match
+    return if_none_match.star_tag or any(t.split('-')[0] == tag for t in if_none_match.as_set())
+
+
+def init_app(server):
+    """Compress and tag the responses of ``server``.
+
+    Register this after any other ``after_request`` instrumentation (Flask
+    runs those hooks in reverse order), so that it sees the bytes actually
+    sent.
+    """
+    @server.after_request
+    def compress_response(response):
+        if response.is_streamed or response.direct_passthrough or response.status_code != 200 \
+                or response.mimetype not in MIMETYPES or 'Content-Encoding' in response.headers:
+            return response
+        data = response.get_data()
+        tag = content_hash(data)
+        encoding = flask.request.accept_encodings.best_match(ENCODINGS) if len(data) >= MIN_SIZE else None
+        response.vary.add('Accept-Encoding')
+        response.set_etag(tag if encoding is None else '%s-%s' % (tag, encoding))
+        if not_modified(tag):
+            response.status_code = 304
+            response.set_data(b'')
+        elif encoding is not None:
+            response.set_data(compressed(data, tag, encoding))
+            response.headers['Content-Encoding'] = encoding
+        return response
+
+    return server
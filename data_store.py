@@ -0,0 +1,277 @@
+"""Lazily loaded per-year data behind ``yr_df_dict`` / ``yr_dm_dict``.
+
+Each ``<kind>_<year>.csv`` is converted once into a directory of NumPy files
+under ``.data_cache/`` (override with ``DATA_CACHE_DIR``).  Numeric columns
+are stored as one 2-D ``.npy`` block per dtype; string columns are
+dictionary-encoded as an ``int32`` code block plus a single UTF-8 blob of the
+distinct values, so loading a year never goes through the CSV parser again.
+A cache entry is rebuilt whenever its source CSV changes size or mtime.
+"""
+import ast
+import json
+import os
+import shutil
+import threading
+import time
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor
+from os.path import join
+
+import numpy as np
+import pandas as pd
+
+
+YEARS = ['2013', '2014', '2015', '2016', '2017', '2018', '2019']
+
+DATA_DIR = os.path.dirname(os.path.abspath(__file__))
+CACHE_DIR = os.environ.get('DATA_CACHE_DIR', join(DATA_DIR, '.data_cache'))
+
+# Bump whenever the on-disk layout changes so stale caches get rebuilt.
+FORMAT_VERSION = 1
+
+# DATA_MMAP=1 memory-maps the numeric blocks and neighbor matrices instead of
+# reading them into each process, so gunicorn workers share the pages.
+MMAP_MODE = 'r' if os.environ.get('DATA_MMAP', '') not in ('', '0') else None
+
+
+def csv_path(kind, year):
+    return join(DATA_DIR, kind + '_' + str(year) + '.csv')
+
+
+def cache_path(kind, year):
+    return join(CACHE_DIR, kind + '_' + str(year))
+
+
+def source_stamp(path):
+    st = os.stat(path)
+    return {'size': st.st_size, 'mtime_ns': st.st_mtime_ns, 'version': FORMAT_VERSION}
+
+
+def write_columnar(df, path, source):
+    tmp = path + '.tmp-' + str(os.getpid()) + '-' + str(threading.get_ident())
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+
+    columns = []
+    blocks = {}
+    codes = []
+    strings = []
+    for col in df.columns:
+        series = df[col]
+        if pd.api.types.is_numeric_dtype(series.dtype):
+            values = series.to_numpy()
+            block = blocks.setdefault(values.dtype.str, [])
+            columns.append({'name': col, 'kind': 'num', 'block': values.dtype.str, 'pos': len(block)})
+            block.append(values)
+            continue
+        # Dictionary-encode strings: most columns are low-cardinality group
+        # labels and colors, and decoding becomes a single fancy index.
+        col_codes, uniques = pd.factorize(series)
+        columns.append({'name': col, 'kind': 'str', 'pos': len(codes),
+                        'start': len(strings), 'stop': len(strings) + len(uniques)})
+        codes.append(col_codes.astype(np.int32))
+        strings.extend(str(v) for v in uniques)
+
+    for dtype, block in blocks.items():
+        np.save(block_file(tmp, dtype), np.vstack(block))
+    np.save(join(tmp, 'codes.npy'), np.vstack(codes) if codes else np.empty((0, len(df)), np.int32))
+    offsets = np.zeros(len(strings) + 1, dtype=np.int64)
+    np.cumsum([len(v) for v in strings], out=offsets[1:])
+    np.save(join(tmp, 'strings.offsets.npy'), offsets)
+    with open(join(tmp, 'strings.txt'), 'w', encoding='utf-8') as f:
+        f.write(''.join(strings))
+    with open(join(tmp, 'meta.json'), 'w') as f:
+        json.dump({'source': source, 'rows': len(df), 'columns': columns}, f)
+
+    # Several gunicorn workers may race to build the same entry; whoever
+    # renames first wins and the others just drop their copy.
+    shutil.rmtree(path, ignore_errors=True)
+    try:
+        os.rename(tmp, path)
+    except OSError:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def read_meta(path):
+    with open(join(path, 'meta.json')) as f:
+        return json.load(f)
+
+
+def block_file(path, dtype):
+    return join(path, 'block%s.npy' % dtype.replace('<', '_').replace('>', '_'))
+
+
+def read_columnar(path, meta=None, mmap_mode=None):
+    meta = read_meta(path) if meta is None else meta
+    blocks = {}
+    codes = np.load(join(path, 'codes.npy'))
+    with open(join(path, 'strings.txt'), encoding='utf-8') as f:
+        text = f.read()
+    offsets = np.load(join(path, 'strings.offsets.npy')).tolist()
+    strings = [text[a:b] for a, b in zip(offsets[:-1], offsets[1:])]
+
+    data = {}
+    for col in meta['columns']:
+        if col['kind'] == 'num':
+            if col['block'] not in blocks:
+                blocks[col['block']] = np.load(block_file(path, col['block']), mmap_mode=mmap_mode)
+            data[col['name']] = blocks[col['block']][col['pos']]
+            continue
+        # Code -1 (missing) picks the trailing NaN.
+        uniques = np.array(strings[col['start']:col['stop']] + [np.nan], dtype=object)
+        data[col['name']] = uniques[codes[col['pos']]]
+    if mmap_mode is None:
+        return pd.DataFrame(data, columns=[col['name'] for col in meta['columns']])
+    # The dict constructor would copy the mapped columns into new blocks;
+    # one-column frames concatenated side by side keep them as views.
+    return pd.concat([pd.DataFrame(values[:, None], columns=[name], copy=False) if values.dtype != object else pd.DataFrame({name: values})
+                      for name, values in data.items()], axis=1)
+
+
+def load_frame(kind, year):
+    src = csv_path(kind, year)
+    path = cache_path(kind, year)
+    stamp = source_stamp(src)
+    try:
+        meta = read_meta(path)
+        if meta['source'] == stamp:
+            return read_columnar(path, meta, mmap_mode=MMAP_MODE)
+    except (OSError, ValueError, KeyError):
+        pass
+
+    df = pd.read_csv(src)
+    try:
+        write_columnar(df, path, stamp)
+        if MMAP_MODE is not None:
+            return read_columnar(path, mmap_mode=MMAP_MODE)
+    except (OSError, ValueError, KeyError):
+        # Read-only checkout: keep serving straight from the CSV.
+        pass
+    return df
+
+
+def load_array(name, year, sources, build):
+    """Return ``build()`` for ``year``, cached as ``<name>_<year>.npy`` until a source changes."""
+    path = join(CACHE_DIR, name + '_' + str(year))
+    stamp = [source_stamp(src) for src in sources]
+    try:
+        with open(path + '.json') as f:
+            if json.load(f) == stamp:
+                return np.load(path + '.npy', mmap_mode=MMAP_MODE)
+    except (OSError, ValueError):
+        pass
+
+    arr = build()
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        tmp = path + '.tmp-' + str(os.getpid()) + '-' + str(threading.get_ident())
+        np.save(tmp + '.npy', arr)
+        os.replace(tmp + '.npy', path + '.npy')
+        with open(tmp + '.json', 'w') as f:
+            json.dump(stamp, f)
+        os.replace(tmp + '.json', path + '.json')
+    except OSError:
+        pass
+    return arr
+
+
+def neighbor_matrix(df, dm):
+    """Turn ``NearestNeighborsORDERED`` lists into an ``int32`` matrix of row positions in ``df``.
+
+    Row ``i`` holds the neighbors of ``df`` row ``i``, nearest first, with
+    ``i`` itself in column 0.  Names that appear more than once in ``df``
+    (share classes) resolve to distinct rows in order of appearance; names
+    missing from ``df`` become -1.
+    """
+    rows_by_name = {}
+    for i, name in enumerate(df['Name']):
+        rows_by_name.setdefault(name, []).append(i)
+
+    # literal_eval rather than splitting on ", " so names containing commas
+    # or quotes come through intact.
+    lists = [ast.literal_eval(s) for s in dm['NearestNeighborsORDERED']]
+    width = max((len(l) for l in lists), default=0)
+    out = np.full((len(df), width), -1, dtype=np.int32)
+
+    companies = dm['Company'].tolist()
+    names = df['Name'].tolist()
+    for j, neighbors in enumerate(lists):
+        if j < len(names) and names[j] == companies[j]:
+            row = j
+        elif companies[j] in rows_by_name:
+            row = rows_by_name[companies[j]][0]
+        else:
+            continue
+        used = {row}
+        out[row, 0] = row
+        for k, name in enumerate(neighbors[1:], start=1):
+            candidates = rows_by_name.get(name, [])
+            pick = next((r for r in candidates if r not in used), candidates[0] if candidates else -1)
+            used.add(pick)
+            out[row, k] = pick
+    return out
+
+
+def load_neighbors(year, df_dict, dm_dict):
+    sources = [csv_path('cons_data1', year), csv_path('d_matrix', year)]
+    return load_array('neighbors', year, sources,
+                      lambda: neighbor_matrix(df_dict[year], dm_dict[year]))
+
+
+class LazyYearDict(Mapping):
+    """Read-only ``{year: value}`` mapping that calls ``loader(year)`` on first access."""
+
+    def __init__(self, loader, years=YEARS):
+        self._loader = loader
+        self._years = [str(yr) for yr in years]
+        self._data = {}
+        self._locks = {yr: threading.Lock() for yr in self._years}
+        self.load_times = {}
+
+    def __getitem__(self, year):
+        year = str(year)
+        try:
+            return self._data[year]
+        except KeyError:
+            pass
+        if year not in self._locks:
+            raise KeyError(year)
+        with self._locks[year]:
+            if year not in self._data:
+                start = time.perf_counter()
+                self._data[year] = self._loader(year)
+                self.load_times[year] = time.perf_counter() - start
+        return self._data[year]
+
+    def __iter__(self):
+        return iter(self._years)
+
+    def __len__(self):
+        return len(self._years)
+
+    def is_loaded(self, year):
+        return str(year) in self._data
+
+    def warm(self, max_workers=None):
+        warm(self, max_workers=max_workers)
+
+
+def warm(*dicts, max_workers=None):
+    """Load every year of every given ``LazyYearDict`` in parallel."""
+    jobs = [(d, yr) for d in dicts for yr in d]
+    with ThreadPoolExecutor(max_workers=max_workers or len(jobs) or 1) as pool:
+        list(pool.map(lambda job: job[0][job[1]], jobs))
+
+
+def build_cache(years=YEARS):
+    df_dict = LazyYearDict(lambda yr: load_frame('cons_data1', yr), years)
+    dm_dict = LazyYearDict(lambda yr: load_frame('d_matrix', yr), years)
+    for yr in years:
+        df_dict[yr], dm_dict[yr]
+        load_neighbors(yr, df_dict, dm_dict)
+
+
+if __name__ == '__main__':
+    start = time.perf_counter()
+    build_cache()
+    print('Built %s in %.2fs' % (CACHE_DIR, time.perf_counter() - start))
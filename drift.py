@@ -0,0 +1,130 @@
+"""Year-over-year drift of each company's nearest-neighbor set.
+
+For every company present in two consecutive years, its top-``k`` neighbors
+(from ``d_matrix_<year>.csv``, matched across years by SID) are compared:
+
+* ``jaccard``: shared neighbors over the union of both sets;
+* ``overlap``: rank-weighted average overlap, the mean over depths ``d = 1..k``
+  of ``|top-d before & top-d after| / d``, so losing the nearest peers costs
+  more than losing the k-th;
+* ``shared``: the number of shared neighbors.
+
+The whole universe is one vectorized pass per year pair over the neighbor
+matrices and is cached in ``.data_cache/`` until a source file changes.
+``init_app`` serves the records as JSON at ``/api/drift``.
+"""
+import flask
+import numpy as np
+
+from data_store import YEARS, csv_path, load_array
+
+
+DRIFT_DTYPE = np.dtype([('sid', np.int64), ('year', 'U4'), ('jaccard', np.float32),
+                        ('overlap', np.float32), ('shared', np.int16)])
+MAX_K = 20
+
+
+def neighbor_sids(df, nn, k):
+    """``(len(df), k)`` SIDs of each row's ``k`` nearest neighbors, -1 where missing."""
+    sids = df['SID'].to_numpy(dtype=np.int64)
+    rows = nn[:, 1:k + 1]
+    out = np.where(rows >= 0, sids[np.maximum(rows, 0)], -1)
+    if out.shape[1] < k:
+        out = np.hstack([out, np.full((len(out), k - out.shape[1]), -1)])
+    return out
+
+
+def compare(before, after):
+    """``(jaccard, overlap, shared)`` of matching rows of two ``(n, k)`` SID matrices."""
+    n, k = before.shape
+    # Missing neighbors (-1 / -2) never match each other.
+    eq = (before[:, :, None] == np.where(after < 0, -2, after)[:, None, :]) & (before[:, :, None] >= 0)
+    shared = eq.sum(axis=(1, 2))
+    size_before = (before >= 0).sum(axis=1)
+    size_after = (after >= 0).sum(axis=1)
+    union = size_before + size_after - shared
+    jaccard = np.where(union > 0, shared / np.maximum(union, 1), 1.0)
+
+    # A neighbor at rank a before and b after is in both top-d prefixes for
+    # every d > max(a, b); count matches by that depth and accumulate.
+    depth = np.maximum.outer(np.arange(k), np.arange(k))
+    row, a, b = np.nonzero(eq)
+    counts = np.bincount(row * k + depth[a, b], minlength=n * k).reshape(n, k)
+    overlap = (np.cumsum(counts, axis=1) / np.arange(1, k + 1)).mean(axis=1)
+    return jaccard, overlap, shared
+
+
+def neighbor_drift(df_dict, nn_dict, k=MAX_K, years=YEARS):
+    """Structured array (``DRIFT_DTYPE``) with one record per company and year it shares with the year before."""
+    parts = []
+    for prev, year in zip(years[:-1], years[1:]):
+        df0, df1 = df_dict[prev], df_dict[year]
+        sid0 = df0['SID'].to_numpy(dtype=np.int64)
+        sid1 = df1['SID'].to_numpy(dtype=np.int64)
+        common, rows0, rows1 = np.intersect1d(sid0, sid1, assume_unique=True, return_indices=True)
+        jaccard, overlap, shared = compare(neighbor_sids(df0, nn_dict[prev], k)[rows0],
+                                           neighbor_sids(df1, nn_dict[year], k)[rows1])
+        part = np.empty(len(common), dtype=DRIFT_DTYPE)
+        part['sid'] = common
+        part['year'] = year
+        part['jaccard'] = jaccard
+        part['overlap'] = overlap
+        part['shared'] = shared
+        parts.append(part)
+    return np.concatenate(parts) if parts else np.empty(0, dtype=DRIFT_DTYPE)
+
+
+def load_drift(df_dict, nn_dict, k=MAX_K, years=YEARS):
+    k = min(max(int(k), 1), MAX_K)
+    sources = [csv_path(kind, yr) for yr in years for kind in ('cons_data1', 'd_matrix')]
+    return load_array('drift_k%d' % k, '%s-%s' % (years[0], years[-1]), sources,
+                      lambda: neighbor_drift(df_dict, nn_dict, k, years))
+
+
+def biggest_movers(drift, year, metric='overlap', limit=None):
+    """Records of ``year`` sorted from the most to the least changed neighbor set."""
+    records = drift[drift['year'] == str(year)]
+    records = records[np.argsort(records[metric], kind='stable')]
+    return records if limit is None else records[:limit]
+
+
+def init_app(server, records, names):
+    """Add the ``/api/drift`` route.
+
+    ``records(k)`` returns the drift records for ``k`` neighbors and
+    ``names(year, sids)`` the companies' names in ``year``.  Query
+    parameters: ``year`` (the later year of the pair; all years if omitted),
+    ``k`` (1-20, default 20), ``sort`` (``overlap``, ``jaccard`` or
+    ``shared``), ``order`` (``asc``, biggest movers first, or ``desc``) and
+    ``limit``.
+    """
+    @server.route('/api/drift')
+    def drift_route():
+        args = flask.request.args
+        try:
+            k = int(args.get('k', MAX_K))
+            limit = int(args['limit']) if 'limit' in args else None
+        except ValueError:
+            flask.abort(400)
+        metric = args.get('sort', 'overlap')
+        order = args.get('order', 'asc')
+        if not 1 <= k <= MAX_K or metric not in ('overlap', 'jaccard', 'shared') or order not in ('asc', 'desc') \
+                or (limit is not None and limit < 0):
+            flask.abort(400)
+        data = records(k)
+        if 'year' in args:
+            if args['year'] not in set(data['year'].tolist()):
+                flask.abort(404)
+            data = data[data['year'] == args['year']]
+        order_rows = np.argsort(data[metric], kind='stable')
+        data = data[order_rows if order == 'asc' else order_rows[::-1]][:limit]
+
+        company = np.empty(len(data), dtype=object)
+        for year in np.unique(data['year']).tolist():
+            sel = data['year'] == year
+            company[sel] = names(year, data['sid'][sel])
+        return flask.jsonify({'k': k, 'sort': metric, 'order': order, 'records': [
+            {'sid': sid, 'name': name, 'year': year, 'jaccard': round(jaccard, 4), 'overlap': round(overlap, 4),
+             'shared': shared} for (sid, year, jaccard, overlap, shared), name in zip(data.tolist(), company)]})
+
+    return server
@@ -0,0 +1,157 @@
+"""Export the rows behind a view as Arrow IPC or Parquet.
+
+``/api/export`` takes the inputs of ``update_graph`` as query parameters:
+``vis_model``, ``cluster_group``, ``yr``, ``comps_selected`` (repeated for
+several companies), ``dims`` and ``n_neighbors``.  It returns the rows that
+view draws, with every ``cons_data1`` column and a ``Year`` column.
+``format=arrow`` (default) gives an Arrow IPC stream and ``format=parquet`` a
+Parquet file.  With ``all_years=1`` the same view is exported for every year
+and stacked into one table.  The companies are picked by name or SID in
+``yr`` and followed by SID, so renamed companies stay in.
+
+Rows are converted from the in-memory frames ``BATCH_ROWS`` at a time and
+each record batch (a Parquet row group) is sent as soon as it is written, so
+an export never holds more than one batch of output.  Needs ``pyarrow``;
+without it the route answers 501.
+"""
+import flask
+import numpy as np
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+from data_store import YEARS
+from indexes import GROUP_COLUMNS, UnknownCompanyError
+
+
+BATCH_ROWS = 65536
+FORMATS = {'arrow': ('application/vnd.apache.arrow.stream', 'arrow'),
+           'parquet': ('application/vnd.apache.parquet', 'parquet')}
+# Derived display columns (see indexes.add_hover_columns) are not exported.
+DERIVED_PREFIXES = ('Hover_', 'Label_')
+
+
+class Sink:
+    """Write-only file object whose contents are taken out with ``drain()``."""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+        data = bytes(data)
+        self.chunks.append(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def export_columns(df):
+    return [col for col in df.columns if not col.startswith(DERIVED_PREFIXES) and not col.startswith('Unnamed')]
+
+
+def arrow_type(frames, col):
+    """One Arrow type for ``col`` across ``frames``, widening ints to floats if any year has floats."""
+    kinds = {df[col].dtype.kind for df in frames}
+    if kinds <= {'i', 'u'}:
+        return pa.int64()
+    if kinds <= {'i', 'u', 'f'}:
+        return pa.float64()
+    if kinds == {'b'}:
+        return pa.bool_()
+    return pa.string()
+
+
+def schema_for(frames):
+    columns = export_columns(frames[0])
+    return pa.schema([('Year', pa.string())] + [(col, arrow_type(frames, col)) for col in columns])
+
+
+def record_batches(parts, schema):
+    """``RecordBatch``es of the ``(year, df, rows)`` parts, at most ``BATCH_ROWS`` rows each."""
+    columns = list(zip(schema.names, schema.types))[1:]
+    for year, df, rows in parts:
+        for start in range(0, len(rows), BATCH_ROWS):
+            sel = rows[start:start + BATCH_ROWS]
+            arrays = [pa.array(np.full(len(sel), year, dtype=object), pa.string())]
+            for col, type in columns:
+                arrays.append(pa.array(df[col].to_numpy()[sel], type, from_pandas=True))
+            yield pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def stream(parts, schema, fmt):
+    sink = Sink()
+    writer = pq.ParquetWriter(sink, schema) if fmt == 'parquet' else pa.ipc.new_stream(sink, schema)
+    for batch in record_batches(parts, schema):
+        writer.write_batch(batch)
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+
+def init_app(server, df_dict, idx_dict, view_rows):
+    """Add the ``/api/export`` route.
+
+    ``view_rows(vis_model, cluster_group, yr, comps_selected, dims,
+    n_neighbors)`` returns the rows of a year's frame that view draws.
+    """
+    @server.route('/api/export')
+    def export_route():
+        if pa is None:
+            flask.abort(501, 'pyarrow is not installed')
+        args = flask.request.args
+        vis_model = args.get('vis_model', 'OVERALL')
+        cluster_group = args.get('cluster_group', 'GICS_SECTOR')
+        yr = args.get('yr')
+        companies = args.getlist('comps_selected')
+        fmt = args.get('format', 'arrow')
+        all_years = args.get('all_years', '') not in ('', '0')
+        dims, n_neighbors = args.get('dims', '2'), args.get('n_neighbors', '1')
+        if fmt not in FORMATS or cluster_group not in GROUP_COLUMNS or dims not in ('2', '3') \
+                or not n_neighbors.isdigit() or (yr is None and (companies or not all_years)):
+            flask.abort(400)
+        if yr is not None and yr not in YEARS:
+            flask.abort(404)
+
+        # Rows are chosen for every year before anything is sent, so a bad
+        # request still gets an error status.
+        try:
+            if companies:
+                df, idx = df_dict[yr], idx_dict[yr]
+                companies = df['SID'].to_numpy()[idx.rows(companies)].tolist()
+            parts = []
+            for year in (YEARS if all_years else [yr]):
+                present = [sid for sid in companies if sid in idx_dict[year]]
+                if companies and not present:
+                    continue
+                rows = view_rows(vis_model, cluster_group, year, present, dims, n_neighbors)
+                parts.append((year, df_dict[year], np.asarray(rows, dtype=np.intp)))
+        except UnknownCompanyError as e:
+            flask.abort(404, str(e))
+        except ValueError as e:
+            flask.abort(400, str(e))
+
+        mimetype, extension = FORMATS[fmt]
+        name = '%s_%s.%s' % (vis_model.lower().replace(' ', '-'), 'all' if all_years else yr, extension)
+        schema = schema_for([df for _, df, _ in parts] or [df_dict[yr or YEARS[0]]])
+        return flask.Response(stream(parts, schema, fmt), mimetype=mimetype,
+                              headers={'Content-Disposition': 'attachment; filename="%s"' % name})
+
+    return server
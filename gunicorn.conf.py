@@ -0,0 +1,25 @@
+"""Gunicorn settings, read by ``gunicorn -c gunicorn.conf.py app:server`` (see Procfile).
+
+The app is imported once in the master with every year already loaded
+(``PRELOAD_DATA``) and the NumPy arrays memory-mapped from ``.data_cache/``
+(``DATA_MMAP``).  Workers are then forked from it and share those pages
+copy-on-write instead of each importing Dash and loading the data again.
+``python -m tools.measure_workers`` reports the memory this saves.
+"""
+import gc
+import os
+
+
+os.environ.setdefault('PRELOAD_DATA', '1')
+os.environ.setdefault('DATA_MMAP', '1')
+
+bind = '0.0.0.0:' + os.environ.get('PORT', '8000')
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+preload_app = True
+
+
+def pre_fork(server, worker):
+    # Objects created while preloading never become garbage.  Freezing them
+    # keeps the collector from writing to their headers in the workers,
+    # which would otherwise un-share the pages holding them.
+    gc.freeze()
@@ -0,0 +1,112 @@
+"""Per-year lookup structures built once from a ``cons_data1`` frame.
+
+Row numbers are positions in that year's frame, which always has a
+``RangeIndex``, so they work with both ``.iloc`` and ``.loc``.
+"""
+import numpy as np
+import pandas as pd
+
+from timings import stage
+
+
+GROUP_COLUMNS = ['ML_sector', 'ML_industry', 'ML_subindustry', 'GICS_SECTOR', 'GICS_INDUSTRY', 'GICS_SUB_INDUSTRY']
+
+# Hover text always names the GICS classification at the grouping's level,
+# whether the points are colored by GICS or by the ML clusters.
+HOVER_LABELS = {'GICS_SECTOR': 'Sector', 'GICS_INDUSTRY': 'Industry', 'GICS_SUB_INDUSTRY': 'Sub-Industry'}
+HOVER_FAMILIES = {
+    'GICS_SECTOR': 'GICS_SECTOR', 'ML_sector': 'GICS_SECTOR',
+    'GICS_INDUSTRY': 'GICS_INDUSTRY', 'ML_industry': 'GICS_INDUSTRY',
+    'GICS_SUB_INDUSTRY': 'GICS_SUB_INDUSTRY', 'ML_subindustry': 'GICS_SUB_INDUSTRY',
+}
+
+
+def add_hover_columns(df):
+    """Add ``Label_<family>`` and ``Hover_<family>`` string columns to a year's frame.
+
+    ``Hover_GICS_SECTOR`` holds e.g. ``"FEDEX CORP (GICS Sector: Industrials)"``;
+    figures slice these instead of concatenating strings per request.
+    """
+    for col, label in HOVER_LABELS.items():
+        # astype(str) keeps missing classifications as 'nan', as before.
+        df['Label_' + col] = df['Proper_' + col].astype(str)
+        df['Hover_' + col] = df['Name'] + ' (GICS ' + label + ': ' + df['Label_' + col] + ')'
+    return df
+
+
+def group_labels(df, idx, grp, codes):
+    """Display names of the ``grp`` groups with ``codes``: GICS names, ML cluster numbers."""
+    if grp in HOVER_LABELS:
+        return df['Label_' + grp].to_numpy()[[idx.group_members[grp][c][0] for c in np.asarray(codes).tolist()]].tolist()
+    return [str(v) for v in idx.group_values[grp][codes].tolist()]
+
+
+class UnknownCompanyError(LookupError):
+
+    def __init__(self, company, year=None):
+        self.company = company
+        self.year = year
+        where = '' if year is None else ' in ' + str(year)
+        super().__init__('Unknown company %r%s' % (company, where))
+
+
+class YearIndex:
+
+    def __init__(self, df, year=None):
+        self.year = year
+        self.size = len(df)
+        # Share classes repeat a name; like the old `.values[0]` lookups, the
+        # first row wins and SIDs can be used to reach the others.
+        self.name_rows = {}
+        for i, name in enumerate(df['Name'].tolist()):
+            self.name_rows.setdefault(name, i)
+        self.sid_rows = dict(zip(df['SID'].tolist(), range(len(df))))
+
+        # Inverted index per grouping column: every row's group code, and
+        # for each code the sorted rows belonging to it.
+        self.group_codes = {}
+        self.group_values = {}
+        self.group_members = {}
+        for grp in GROUP_COLUMNS:
+            codes, uniques = pd.factorize(df[grp], sort=True)
+            order = np.argsort(codes, kind='stable')
+            bounds = np.cumsum(np.bincount(codes, minlength=len(uniques)))[:-1]
+            self.group_codes[grp] = codes.astype(np.int32)
+            self.group_values[grp] = np.asarray(uniques)
+            self.group_members[grp] = np.split(order, bounds)
+
+    @stage('lookup')
+    def row(self, company):
+        """Row of ``company``, given as a name or a SID."""
+        try:
+            return self.name_rows[company]
+        except (KeyError, TypeError):
+            pass
+        try:
+            return self.sid_rows[int(company)]
+        except (KeyError, TypeError, ValueError):
+            raise UnknownCompanyError(company, self.year) from None
+
+    @stage('lookup')
+    def rows(self, companies):
+        return np.fromiter((self.row(c) for c in companies), dtype=np.intp, count=len(companies))
+
+    def __contains__(self, company):
+        try:
+            self.row(company)
+        except UnknownCompanyError:
+            return False
+        return True
+
+    def group_rows(self, grp, value):
+        """Sorted rows whose ``grp`` column equals ``value``."""
+        code = np.searchsorted(self.group_values[grp], value)
+        if code == len(self.group_values[grp]) or self.group_values[grp][code] != value:
+            return np.empty(0, dtype=np.intp)
+        return self.group_members[grp][code]
+
+    def kernel_rows(self, grp, companies):
+        """Sorted union of the ``grp`` groups of ``companies``, each row once."""
+        codes = np.unique(self.group_codes[grp][self.rows(companies)])
+        # Groups partition the rows, so distinct codes never share members.
+        return np.sort(np.concatenate([self.group_members[grp][c] for c in codes]))
@@ -0,0 +1,81 @@
+"""Level of detail for OVERALL views.
+
+With ``LOD_POINTS`` set (see app.py), an OVERALL view never sends more than
+that many markers:
+
+* zoomed out, companies are binned on a grid over the view and each
+  (cell, group) pair becomes one marker.  The marker sits at the members'
+  mean position, is sized by the member count and is named after the member
+  closest to that mean.  The grid is coarsened until the pairs fit the budget;
+  if a view has more groups than that, the smallest ones share a marker;
+* zoomed in (``relayoutData`` with axis ranges, 2D only), the companies
+  inside the viewport come from the year's spatial index
+  (``EmbeddingIndex.query_box``).  They are drawn individually if they fit the
+  budget, and binned over the viewport otherwise.
+"""
+import numpy as np
+
+
+# relayoutData that says nothing about the axes (autosize, drag mode, ...).
+UNCHANGED = object()
+
+
+def viewport(relayout):
+    """``(lo, hi)`` bounds of a zoomed 2D view, None when zoomed out, or ``UNCHANGED``."""
+    if not relayout:
+        return UNCHANGED
+    if relayout.get('xaxis.autorange') or relayout.get('yaxis.autorange'):
+        return None
+    lo, hi = [-np.inf, -np.inf], [np.inf, np.inf]
+    found = False
+    for a, axis in enumerate(('xaxis', 'yaxis')):
+        bounds = relayout.get(axis + '.range')
+        if bounds is None and axis + '.range[0]' in relayout:
+            bounds = relayout[axis + '.range[0]'], relayout.get(axis + '.range[1]')
+        if bounds is None:
+            continue
+        try:
+            low, high = sorted(float(b) for b in bounds)
+        except (TypeError, ValueError):
+            return UNCHANGED
+        lo[a], hi[a] = low, high
+        found = True
+    return (lo, hi) if found else UNCHANGED
+
+
+def aggregate(points, codes, budget):
+    """Bin ``points`` on a grid until at most ``budget`` (cell, code) pairs remain.
+
+    With more distinct codes than ``budget``, the ``budget - 1`` largest
+    codes keep a marker each and the others are merged into one.  Returns
+    ``(centers, counts, representatives)``: each pair's mean position, member
+    count and the row of its member nearest that mean.
+    """
+    n, dim = points.shape
+    lo, hi = points.min(axis=0), points.max(axis=0)
+    span = np.where(hi > lo, hi - lo, 1.0)
+    cells = max(int(budget ** (1.0 / dim)), 1)
+    while True:
+        bins = np.minimum(((points - lo) / span * cells).astype(np.int64), cells - 1)
+        cell = np.ravel_multi_index(bins.T, (cells,) * dim)
+        keys, inverse = np.unique(cell * (codes.max() + 1) + codes, return_inverse=True)
+        if len(keys) <= budget or cells == 1:
+            break
+        cells = max(int(cells / 1.25), 1)
+
+    inverse = inverse.ravel()
+    if len(keys) > budget:
+        # One cell is left, so keys are codes: merge all but the largest.
+        sizes = np.bincount(inverse, minlength=len(keys))
+        kept = np.zeros(len(keys), dtype=bool)
+        kept[np.argsort(-sizes, kind='stable')[:budget - 1]] = True
+        keys, inverse = np.unique(np.where(kept[inverse], inverse, len(keys)), return_inverse=True)
+        inverse = inverse.ravel()
+    assert len(keys) <= budget
+    counts = np.bincount(inverse, minlength=len(keys))
+    centers = np.stack([np.bincount(inverse, points[:, a], minlength=len(keys)) for a in range(dim)], axis=1) / counts[:, None]
+    # Nearest member first within each pair, then take the first of each.
+    d2 = np.sum((points - centers[inverse]) ** 2, axis=1)
+    order = np.lexsort((d2, inverse))
+    first = np.r_[0, np.flatnonzero(np.diff(inverse[order])) + 1]
+    return centers, counts, order[first]
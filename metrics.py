@@ -0,0 +1,211 @@
+"""In-process metrics in the Prometheus text format, served at ``/metrics``.
+
+``init_app(server)`` times every ``/_dash-update-component`` request per
+callback and records its response size.  ``update_graph`` adds request counts
+per view and year and, through ``staged``, the time spent in each stage of
+``generate_vis`` (see ``timings.py``).  Gauges for the figure cache and the
+per-year data loads are read when ``/metrics`` is scraped.
+
+Each process keeps its own numbers, so with several gunicorn workers a
+scrape sees whichever worker answered it.  Recording a sample takes one lock
+and a bisect.
+"""
+import bisect
+import functools
+import threading
+import time
+
+import flask
+
+from timings import collect
+
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join('%s="%s"' % (k, escape(v)) for k, v in labels) + '}'
+
+
+class Metric:
+
+    kind = None
+
+    def __init__(self, name, help, registry=None):
+        self.name = name
+        self.help = help
+        self._lock = threading.Lock()
+        self._values = {}
+        (registry if registry is not None else REGISTRY).append(self)
+
+    def key(self, labels):
+        return tuple(sorted(labels.items()))
+
+    def render(self):
+        lines = ['# HELP %s %s' % (self.name, self.help), '# TYPE %s %s' % (self.name, self.kind)]
+        with self._lock:
+            items = sorted(self._values.items())
+        for labels, value in items:
+            lines.extend(self.samples(labels, value))
+        return lines
+
+
+class Counter(Metric):
+
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self, labels, value):
+        return ['%s%s %s' % (self.name, format_labels(labels), value)]
+
+
+class Histogram(Metric):
+
+    kind = 'histogram'
+
+    def __init__(self, name, help, buckets=LATENCY_BUCKETS, registry=None):
+        super().__init__(name, help, registry)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self.key(labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][i] += 1
+            state[1] += value
+            state[2] += 1
+
+    def samples(self, labels, value):
+        counts, total, count = value
+        lines = []
+        cumulative = 0
+        for bound, n in zip(self.buckets + (float('inf'),), counts):
+            cumulative += n
+            le = '+Inf' if bound == float('inf') else repr(bound)
+            lines.append('%s_bucket%s %d' % (self.name, format_labels(labels + (('le', le),)), cumulative))
+        lines.append('%s_sum%s %r' % (self.name, format_labels(labels), total))
+        lines.append('%s_count%s %d' % (self.name, format_labels(labels), count))
+        return lines
+
+
+class Gauge(Metric):
+    """Gauge whose samples come from ``collect()`` at scrape time."""
+
+    kind = 'gauge'
+
+    def __init__(self, name, help, collect, registry=None):
+        super().__init__(name, help, registry)
+        self.collect = collect
+
+    def render(self):
+        lines = ['# HELP %s %s' % (self.name, self.help), '# TYPE %s %s' % (self.name, self.kind)]
+        samples = sorted((tuple(sorted(labels.items())), value) for labels, value in self.collect())
+        for labels, value in samples:
+            lines.append('%s%s %r' % (self.name, format_labels(labels), value))
+        return lines
+
+
+REGISTRY = []
+
+callback_seconds = Histogram('dash_callback_seconds', 'Time to answer a Dash callback request, by callback output.')
+callback_bytes = Histogram('dash_callback_response_bytes', 'Size of Dash callback responses, by callback output.', SIZE_BUCKETS)
+callback_errors = Counter('dash_callback_errors_total', 'Dash callback requests answered with a 5xx status.')
+stage_seconds = Histogram('generate_vis_stage_seconds',
+                          'Time per update_graph request spent in each stage: lookup, filter, figure, serialize, '
+                          'and dash for Dash decoding, validating and encoding around the callback.')
+graph_requests = Counter('graph_requests_total', 'update_graph requests by view, year, dimension and how the figure was produced.')
+
+
+def render():
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+def staged(fn, name=None):
+    """Record ``timings`` stages of a callback for the current request's metrics.
+
+    ``name`` (default ``fn.__name__``) names the callback, e.g. in profiles.
+    """
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        with collect() as t:
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                if flask.has_request_context():
+                    flask.g.metrics_stages = t
+                    flask.g.metrics_callback_seconds = time.perf_counter() - start
+    if name is not None:
+        wrapper.__name__ = wrapper.__qualname__ = name
+    return wrapper
+
+
+def init_app(server, year_dicts=None, figure_cache=None):
+    """Instrument ``server`` and add the ``/metrics`` route.
+
+    ``year_dicts`` maps a name to a ``LazyYearDict`` whose load times are
+    exported; ``figure_cache`` is an ``LRUCache`` whose stats are exported.
+    """
+    @server.before_request
+    def start_timer():
+        if flask.request.path.endswith('/_dash-update-component'):
+            flask.g.metrics_start = time.perf_counter()
+
+    @server.after_request
+    def record(response):
+        start = flask.g.pop('metrics_start', None)
+        if start is None:
+            return response
+        elapsed = time.perf_counter() - start
+        body = flask.request.get_json(silent=True) or {}
+        callback = body.get('output', 'unknown')
+        callback_seconds.observe(elapsed, callback=callback)
+        if response.content_length is not None:
+            callback_bytes.observe(response.content_length, callback=callback)
+        if response.status_code >= 500:
+            callback_errors.inc(callback=callback)
+        stages = flask.g.pop('metrics_stages', None)
+        if stages is not None:
+            # Whatever the callback itself did not spend is Dash decoding and
+            # validating the request and encoding the response; Dash does all
+            # of it around the callback, so it can't be told apart here.
+            stages = dict(stages, dash=elapsed - flask.g.pop('metrics_callback_seconds', elapsed))
+            for name, seconds in stages.items():
+                stage_seconds.observe(seconds, stage=name)
+        return response
+
+    def data_loads():
+        for name, d in (year_dicts or {}).items():
+            for year, seconds in list(d.load_times.items()):
+                yield {'data': name, 'year': year}, seconds
+
+    def cache_stats():
+        if figure_cache is not None:
+            for key, value in figure_cache.stats().items():
+                yield {'stat': key}, value
+
+    Gauge('data_load_seconds', 'Seconds it took to load each year of each data set in this process.', data_loads)
+    Gauge('figure_cache', 'Figure cache entries, bytes, limits, hits, misses and evictions.', cache_stats)
+
+    @server.route('/metrics')
+    def metrics_route():
+        return flask.Response(render(), mimetype='text/plain; version=0.0.4')
+
+    return server
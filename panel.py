@@ -0,0 +1,85 @@
+"""SID-aligned panel of every company across every year.
+
+``yr_df_dict`` holds one frame per year, so following a company through time
+means a lookup per year.  ``Panel`` lines all years up once: company ``i``
+(by SID) in year ``j`` sits at ``rows[i, j]`` of that year's frame, or -1 if
+it is missing that year (``mask`` is ``rows >= 0``).  Coordinates, group
+codes and colors are stored as ``(companies, years, ...)`` arrays, so a
+multi-year query is a single slice.
+"""
+import numpy as np
+import pandas as pd
+
+from data_store import YEARS
+from indexes import GROUP_COLUMNS, UnknownCompanyError
+
+
+class Panel:
+
+    def __init__(self, df_dict, years=YEARS, method='TSNE'):
+        self.years = [str(yr) for yr in years]
+        frames = [df_dict[yr] for yr in self.years]
+        self.sids = np.unique(np.concatenate([df['SID'].to_numpy() for df in frames]))
+        self.sid_index = dict(zip(self.sids.tolist(), range(len(self.sids))))
+        n, m = len(self.sids), len(self.years)
+
+        self.rows = np.full((n, m), -1, dtype=np.int32)
+        for j, df in enumerate(frames):
+            self.rows[np.searchsorted(self.sids, df['SID'].to_numpy()), j] = np.arange(len(df))
+        self.mask = self.rows >= 0
+        present = np.nonzero(self.mask)
+
+        self.coords = {}
+        for dim in (2, 3):
+            cols = [axis + str(dim) + method for axis in 'XYZ'[:dim]]
+            out = np.full((n, m, dim), np.nan)
+            for j, df in enumerate(frames):
+                sel = present[1] == j
+                out[present[0][sel], j] = df[cols].to_numpy(dtype=np.float64)[self.rows[present[0][sel], j]]
+            self.coords[dim] = out
+
+        # Group values and colors are coded over all years at once, so a
+        # code means the same group in every year; -1 marks missing years.
+        self.names = self.take(frames, 'Name', fill='')
+        self.group_codes = {}
+        self.group_values = {}
+        self.color_codes = {}
+        self.palettes = {}
+        for grp in GROUP_COLUMNS:
+            self.group_codes[grp], self.group_values[grp] = self.encode(frames, grp)
+            self.color_codes[grp], self.palettes[grp] = self.encode(frames, grp + '_Color')
+
+    def take(self, frames, col, fill=None):
+        out = np.full(self.rows.shape, fill, dtype=object)
+        for j, df in enumerate(frames):
+            present = self.mask[:, j]
+            out[present, j] = df[col].to_numpy(dtype=object)[self.rows[present, j]]
+        return out
+
+    def encode(self, frames, col):
+        values = self.take(frames, col)
+        codes, uniques = pd.factorize(values[self.mask], sort=True)
+        out = np.full(self.rows.shape, -1, dtype=np.int32)
+        out[self.mask] = codes
+        return out, np.asarray(uniques)
+
+    def index(self, sids):
+        """Panel positions of ``sids``."""
+        out = np.empty(len(sids), dtype=np.intp)
+        for k, sid in enumerate(sids):
+            try:
+                out[k] = self.sid_index[int(sid)]
+            except (KeyError, TypeError, ValueError):
+                raise UnknownCompanyError(sid) from None
+        return out
+
+    def trajectories(self, sids, dim=2):
+        """``(coords, mask)`` of ``sids`` across all years: ``(k, years, dim)`` and ``(k, years)``."""
+        i = self.index(sids)
+        return self.coords[dim][i], self.mask[i]
+
+    def latest_names(self, sids):
+        """Each company's name in the last year it appears."""
+        i = self.index(sids)
+        last = self.mask.shape[1] - 1 - np.argmax(self.mask[i, ::-1], axis=1)
+        return self.names[i, last]
@@ -0,0 +1,110 @@
+"""Compact trace encoding for figures sent to the browser.
+
+The default traces carry one hex color string and one full hover string per
+point plus float64 coordinates.  The compact form sends instead:
+
+* an integer color code per point with a discrete ``colorscale`` listing each
+  distinct color once,
+* coordinates rounded to ``precision`` decimals (and cast to float32 when
+  Plotly ships arrays as typed binary data),
+* one trace per hover label, so the " (GICS Sector: Energy)" part of the
+  hover text is written once per trace in ``hovertemplate`` and only the
+  company name travels per point.  The palette sits once in a shared
+  ``layout.coloraxis`` and the marker style in the template's trace defaults,
+  so extra traces cost only their own arrays.
+"""
+import numpy as np
+import pandas as pd
+import plotly
+import plotly.graph_objects as go
+
+from indexes import HOVER_FAMILIES, HOVER_LABELS
+
+
+# Plotly >= 6 serializes numpy arrays as base64 typed arrays, where float32
+# halves the size.  Older versions write JSON lists, where float32 values
+# print with spurious digits and rounded float64 is shorter.
+TYPED_ARRAYS = int(plotly.__version__.split('.')[0]) >= 6
+
+
+def discrete_colorscale(colors):
+    """Return ``(codes, colorscale, cmax)`` for an array of color strings."""
+    codes, uniques = pd.factorize(np.asarray(colors), sort=True)
+    k = max(len(uniques), 1)
+    colorscale = []
+    for i, color in enumerate(uniques):
+        colorscale.append([i / k, color])
+        colorscale.append([(i + 1) / k, color])
+    if len(uniques) == 1:
+        colorscale = [[0, uniques[0]], [1, uniques[0]]]
+    dtype = np.uint8 if k <= 256 else np.uint16
+    # With cmin=-0.5 and cmax=k-0.5 code i lands in the middle of its band.
+    return codes.astype(dtype), colorscale, k - 0.5
+
+
+def round_coords(values, precision=3):
+    values = np.round(np.asarray(values, dtype=np.float64), precision)
+    return values.astype(np.float32) if TYPED_ARRAYS else values
+
+
+def compact_figure(scatter, coords, colors, names, labels, hover_prefix=' (', size=5, opacity=0.8, precision=3):
+    """Build a compact figure; see the module docstring for the encoding."""
+    codes, colorscale, cmax = discrete_colorscale(colors)
+    coords = {axis: round_coords(values, precision) for axis, values in coords.items()}
+    names = np.asarray(names, dtype=object)
+
+    label_codes, label_values = pd.factorize(np.asarray(labels, dtype=object), sort=True)
+    order = np.argsort(label_codes, kind='stable')
+    bounds = np.cumsum(np.bincount(label_codes, minlength=len(label_values)))[:-1]
+
+    traces = []
+    for label, rows in zip(label_values, np.split(order, bounds)):
+        traces.append(scatter(
+            **{axis: values[rows] for axis, values in coords.items()},
+            marker={'color': codes[rows], 'coloraxis': 'coloraxis'},
+            text=names[rows],
+            hovertemplate='%{text}' + hover_prefix + str(label) + ')<extra></extra>',
+        ))
+
+    # Settings shared by every trace live once in the layout: the palette in
+    # a shared coloraxis and the marker style in the template's trace defaults.
+    fig = go.Figure(data=traces)
+    fig.update_layout(
+        coloraxis={'colorscale': colorscale, 'cmin': -0.5, 'cmax': cmax, 'showscale': False},
+        showlegend=False,
+    )
+    fig.layout.template.data[scatter.__name__.lower()] = [
+        scatter(mode='markers', marker={'size': size, 'opacity': opacity})
+    ]
+    return fig
+
+
+def client_year_data(year, df, idx, neighbors, layout):
+    """Everything the browser needs to draw any view of ``year`` by itself.
+
+    Used by the client-side rendering mode: sent once per year into a
+    ``dcc.Store`` and filtered by ``assets/clientside.js``.  Coordinates are
+    not rounded, so the browser ranks EMBEDDING NEIGHBORS on the same
+    distances as ``EmbeddingIndex``.
+    """
+    coords = {}
+    for col in ('X2TSNE', 'Y2TSNE', 'X3TSNE', 'Y3TSNE', 'Z3TSNE'):
+        coords[col] = df[col].to_numpy(dtype=np.float64).tolist()
+    groups = {}
+    for grp, codes in idx.group_codes.items():
+        color_codes, palette = pd.factorize(df[grp + '_Color'])
+        groups[grp] = {'codes': codes.tolist(), 'colors': color_codes.tolist(), 'palette': list(palette)}
+    hover = {}
+    for col, title in HOVER_LABELS.items():
+        codes, labels = pd.factorize(df['Label_' + col])
+        hover[col] = {'title': title, 'codes': codes.tolist(), 'labels': list(labels)}
+    return {
+        'year': str(year),
+        'names': df['Name'].tolist(),
+        'coords': coords,
+        'groups': groups,
+        'hover': hover,
+        'hover_families': HOVER_FAMILIES,
+        'neighbors': neighbors.tolist(),
+        'layout': layout,
+    }
@@ -0,0 +1,138 @@
+"""Pre-rendered figure JSON for every OVERALL view (year x grouping x 2D/3D).
+
+    python prerender.py
+
+writes ``prerendered/overall_<year>_<grp>_<dim>d.<hash>.json`` plus a
+``manifest.json``.  ``update_graph`` and ``/api/figure`` send those files'
+bytes (``load_bytes``) as they are instead of building the figure (see
+raw_json.py), and fall back to live rendering when an artifact is missing,
+fails its content hash, or was built from different data, code or figure
+options.
+"""
+import glob
+import hashlib
+import json
+import os
+import threading
+import time
+from os.path import basename, join
+
+from data_store import DATA_DIR, YEARS, csv_path
+from indexes import GROUP_COLUMNS
+
+
+ARTIFACT_DIR = os.environ.get('PRERENDER_DIR', join(DATA_DIR, 'prerendered'))
+DIMS = ['2', '3']
+
+_manifest = None
+_source_hashes = {}
+_lock = threading.Lock()
+
+
+def sha256_file(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def renderer_fingerprint():
+    # Any code change may change the figures, so every module next to
+    # app.py is part of the fingerprint.
+    h = hashlib.sha256()
+    for path in sorted(glob.glob(join(DATA_DIR, '*.py'))):
+        h.update(basename(path).encode())
+        with open(path, 'rb') as f:
+            h.update(f.read())
+    return h.hexdigest()
+
+
+def source_hash(year):
+    year = str(year)
+    if year not in _source_hashes:
+        _source_hashes[year] = sha256_file(csv_path('cons_data1', year))
+    return _source_hashes[year]
+
+
+def overall_key(year, grp, dim):
+    return 'overall_%s_%s_%sd' % (year, grp, dim)
+
+
+def read_manifest():
+    global _manifest
+    with _lock:
+        if _manifest is None:
+            try:
+                with open(join(ARTIFACT_DIR, 'manifest.json')) as f:
+                    manifest = json.load(f)
+                if manifest.get('renderer') != renderer_fingerprint():
+                    manifest = {'figures': {}}
+            except (OSError, ValueError):
+                manifest = {'figures': {}}
+            _manifest = manifest
+    return _manifest
+
+
+def load_bytes(year, grp, dim, options=None):
+    """Raw JSON of a pre-rendered OVERALL figure, or None if unavailable or stale."""
+    manifest = read_manifest()
+    if manifest.get('options') != options:
+        return None
+    entry = manifest['figures'].get(overall_key(year, grp, dim))
+    if entry is None or entry['source'] != source_hash(year):
+        return None
+    try:
+        with open(join(ARTIFACT_DIR, entry['file']), 'rb') as f:
+            data = f.read()
+    except OSError:
+        return None
+    if hashlib.sha256(data).hexdigest() != entry['sha256']:
+        return None
+    return data
+
+
+def load(year, grp, dim, options=None):
+    data = load_bytes(year, grp, dim, options)
+    return None if data is None else json.loads(data)
+
+
+def render_all(render_figure, options=None, years=YEARS, groups=GROUP_COLUMNS, dims=DIMS):
+    """Render every OVERALL figure with ``render_figure`` and write the manifest.
+
+    ``options`` records the figure settings the artifacts were rendered with;
+    ``load`` only serves them to callers asking for the same settings.
+    """
+    import plotly
+
+    os.makedirs(ARTIFACT_DIR, exist_ok=True)
+    figures = {}
+    for yr in years:
+        for grp in groups:
+            for dim in dims:
+                fig = render_figure('OVERALL', grp, yr, None, dim, '1')
+                data = json.dumps(fig, cls=plotly.utils.PlotlyJSONEncoder, separators=(',', ':')).encode()
+                digest = hashlib.sha256(data).hexdigest()
+                name = '%s.%s.json' % (overall_key(yr, grp, dim), digest[:12])
+                with open(join(ARTIFACT_DIR, name), 'wb') as f:
+                    f.write(data)
+                figures[overall_key(yr, grp, dim)] = {'file': name, 'sha256': digest, 'source': source_hash(yr)}
+
+    for path in glob.glob(join(ARTIFACT_DIR, 'overall_*.json')):
+        if basename(path) not in {entry['file'] for entry in figures.values()}:
+            os.remove(path)
+    manifest = {'renderer': renderer_fingerprint(), 'options': options, 'figures': figures}
+    with open(join(ARTIFACT_DIR, 'manifest.json.tmp'), 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(join(ARTIFACT_DIR, 'manifest.json.tmp'), join(ARTIFACT_DIR, 'manifest.json'))
+    return manifest
+
+
+if __name__ == '__main__':
+    from app import figure_options, render_figure
+
+    start = time.perf_counter()
+    manifest = render_all(render_figure, options=figure_options)
+    total = sum(os.path.getsize(join(ARTIFACT_DIR, e['file'])) for e in manifest['figures'].values())
+    print('Rendered %d figures (%.1f MB) to %s in %.1fs' % (
+        len(manifest['figures']), total / 1e6, ARTIFACT_DIR, time.perf_counter() - start))
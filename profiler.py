@@ -0,0 +1,207 @@
+"""Opt-in profiling of callback requests.
+
+``profile_callbacks`` wraps every server-side callback of the Dash app with
+``profiled``, so profiles cover ``get_companies``, ``update_movers`` and the
+others as well as ``update_graph``.  Profiling is off unless configured,
+and then only for a sample of calls:
+
+* ``PROFILE_SAMPLE=0.05`` profiles a random 5% of calls;
+* ``PROFILE_SLOW_MS=500`` profiles every call but keeps only the profiles of
+  calls that took longer than 500 ms;
+* ``PROFILE_MODE=cprofile`` (default) writes ``cProfile`` stats (``.prof``, for
+  ``pstats``/snakeviz); ``PROFILE_MODE=stacks`` samples the call's stack every
+  ``PROFILE_INTERVAL_MS`` (default 1) and writes collapsed stacks (``.folded``)
+  ready for ``flamegraph.pl`` or speedscope.
+
+Profiles go to ``PROFILE_DIR`` (default ``profiles/``), named after the time,
+duration and inputs of the call, each with a ``.json`` file holding the full
+inputs.  With ``PROFILE_TOKEN`` set, ``/_profiler`` shows the settings and
+profiles (GET) and changes the settings at runtime (POST, form or query
+parameters ``sample``, ``slow_ms``, ``mode``); both need the token in the
+``X-Profile-Token`` header or ``token`` parameter.
+
+When neither sampling nor a threshold is set, a profiled function costs one
+attribute check per call.
+"""
+import cProfile
+import functools
+import hmac
+import inspect
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from os.path import join
+
+import flask
+
+from data_store import DATA_DIR
+
+
+class Settings:
+
+    def __init__(self):
+        self.sample = float(os.environ.get('PROFILE_SAMPLE', 0))
+        self.slow_ms = float(os.environ.get('PROFILE_SLOW_MS', 0))
+        self.mode = os.environ.get('PROFILE_MODE', 'cprofile')
+        self.interval = float(os.environ.get('PROFILE_INTERVAL_MS', 1)) / 1000
+        self.directory = os.environ.get('PROFILE_DIR', join(DATA_DIR, 'profiles'))
+
+    @property
+    def enabled(self):
+        return self.sample > 0 or self.slow_ms > 0
+
+    def as_dict(self):
+        return {'sample': self.sample, 'slow_ms': self.slow_ms, 'mode': self.mode,
+                'interval_ms': self.interval * 1000, 'directory': self.directory}
+
+
+settings = Settings()
+
+
+class StackSampler:
+    """Collapsed stacks of one thread, sampled from a background thread."""
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append('%s (%s:%d)' % (code.co_name, os.path.basename(code.co_filename), code.co_firstlineno))
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def dump(self, path):
+        with open(path, 'w') as f:
+            for stack, count in self.stacks.most_common():
+                f.write('%s %d\n' % (stack, count))
+
+
+def tag(inputs):
+    """Short file-name-safe summary of the inputs."""
+    parts = []
+    for value in inputs.values():
+        if value is None:
+            continue
+        if isinstance(value, (list, tuple)):
+            value = '%d-items' % len(value) if len(value) > 1 else (value[0] if value else '')
+        parts.append(re.sub(r'[^A-Za-z0-9]+', '-', str(value)).strip('-')[:24])
+    return '_'.join(p for p in parts if p)
+
+
+def save(profile, inputs, seconds, name):
+    os.makedirs(settings.directory, exist_ok=True)
+    base = join(settings.directory, '%s_%s_%dms_%s' % (
+        time.strftime('%Y%m%d-%H%M%S'), name, seconds * 1000, tag(inputs)))
+    if isinstance(profile, StackSampler):
+        profile.dump(base + '.folded')
+    else:
+        profile.dump_stats(base + '.prof')
+    with open(base + '.json', 'w') as f:
+        json.dump({'callback': name, 'seconds': seconds, 'inputs': inputs, 'mode': settings.mode}, f,
+                  indent=1, default=str)
+
+
+def profiled(fn):
+    """Profile calls of ``fn`` according to ``settings``."""
+    signature = inspect.signature(fn)
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        if not settings.enabled:
+            return fn(*args, **kwargs)
+        sampled = settings.sample > 0 and random.random() < settings.sample
+        if not sampled and settings.slow_ms <= 0:
+            return fn(*args, **kwargs)
+
+        if settings.mode == 'stacks':
+            profile = StackSampler(threading.get_ident(), settings.interval)
+            profile.start()
+        else:
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+            except ValueError:
+                # Python >= 3.12 allows one active cProfile per process.
+                return fn(*args, **kwargs)
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            seconds = time.perf_counter() - start
+            if isinstance(profile, StackSampler):
+                profile.stop()
+            else:
+                profile.disable()
+            if sampled or seconds * 1000 >= settings.slow_ms:
+                inputs = dict(signature.bind(*args, **kwargs).arguments)
+                try:
+                    save(profile, inputs, seconds, fn.__name__)
+                except OSError:
+                    pass
+    return wrapper
+
+
+def profile_callbacks(app):
+    """Make ``app.callback`` profile every callback registered from now on."""
+    register = app.callback
+
+    @functools.wraps(register)
+    def callback(*args, **kwargs):
+        decorator = register(*args, **kwargs)
+        return lambda fn: decorator(profiled(fn))
+    app.callback = callback
+    return app
+
+
+def init_app(server):
+    """Add the token-protected ``/_profiler`` route if ``PROFILE_TOKEN`` is set."""
+    token = os.environ.get('PROFILE_TOKEN')
+    if not token:
+        return server
+
+    @server.route('/_profiler', methods=['GET', 'POST'])
+    def profiler_route():
+        values = flask.request.values
+        given = flask.request.headers.get('X-Profile-Token') or values.get('token', '')
+        if not hmac.compare_digest(given.encode(), token.encode()):
+            flask.abort(403)
+        if flask.request.method == 'POST':
+            try:
+                if 'sample' in values:
+                    settings.sample = min(max(float(values['sample']), 0.0), 1.0)
+                if 'slow_ms' in values:
+                    settings.slow_ms = max(float(values['slow_ms']), 0.0)
+            except ValueError:
+                flask.abort(400)
+            if 'mode' in values:
+                if values['mode'] not in ('cprofile', 'stacks'):
+                    flask.abort(400)
+                settings.mode = values['mode']
+        try:
+            files = sorted(os.listdir(settings.directory))
+        except OSError:
+            files = []
+        return flask.jsonify(dict(settings.as_dict(), enabled=settings.enabled, profiles=files))
+
+    return server
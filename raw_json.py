@@ -0,0 +1,42 @@
+"""Encoded JSON sent inside Dash callback responses as is.
+
+Dash encodes whatever a callback returns, so a figure that is already JSON
+(from ``figure_cache`` or a pre-rendered file) would be decoded only to be
+encoded again.  Instead a callback returns ``embed(data)``, a placeholder
+string, and ``init_app(server)`` swaps the placeholder, quotes included, for
+``data`` in the encoded response.  Outside a request ``embed`` returns the
+decoded value.
+"""
+import json
+import uuid
+
+import flask
+
+
+def embed(data):
+    """Stand-in for the JSON ``data`` in the current callback's return value."""
+    if not flask.has_request_context():
+        return json.loads(data)
+    placeholder = 'raw-json-' + uuid.uuid4().hex
+    flask.g.setdefault('raw_json', {})[placeholder] = data
+    return placeholder
+
+
+def init_app(server):
+    """Splice embedded JSON into responses.
+
+    Register this after any ``after_request`` hook that reads or rewrites
+    the body (compression, ETags), so it runs before them.
+    """
+    @server.after_request
+    def splice(response):
+        embedded = flask.g.pop('raw_json', None)
+        if not embedded or response.direct_passthrough:
+            return response
+        body = response.get_data()
+        for placeholder, data in embedded.items():
+            body = body.replace(b'"' + placeholder.encode() + b'"', data, 1)
+        response.set_data(body)
+        return response
+
+    return server
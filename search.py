@@ -0,0 +1,113 @@
+"""Type-ahead company search over one year's names and SIDs.
+
+``CompanySearch`` is built once per year and answers ``search(text)`` with
+the best ``limit`` company names, best first:
+
+1. names that start with the text;
+2. names with a word that starts with it (``PARCEL`` finds
+   ``UNITED PARCEL SERVICE INC``);
+3. companies whose SID starts with it;
+4. if those are not enough, names sharing the most character trigrams with
+   it, preferring names with a word that starts like it, which tolerates
+   typos (``FEDX`` ranks ``FEDEX CORP`` first).
+
+Steps 1-3 are binary searches in sorted lists and step 4 sums posting lists
+of an inverted trigram index with NumPy.  So a query touches only the
+matches, not every company, and stays fast for much larger universes.
+Matching ignores case and punctuation.
+"""
+import bisect
+import re
+from collections import defaultdict
+
+import numpy as np
+
+
+LIMIT = 20
+# Trigram matches must contain at least this fraction of the text's trigrams.
+MIN_SIMILARITY = 0.5
+
+
+def normalize(text):
+    return re.sub(r'[^A-Z0-9&]+', ' ', str(text).upper()).strip()
+
+
+def trigrams(text):
+    padded = ' %s ' % text
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class CompanySearch:
+
+    def __init__(self, names, sids):
+        # One entry per distinct name; share classes add their SIDs to it.
+        self.names = sorted(set(names))
+        ids = {name: i for i, name in enumerate(self.names)}
+        self.sids = [[] for _ in self.names]
+        for name, sid in zip(names, sids):
+            self.sids[ids[name]].append(str(sid))
+
+        keys = [normalize(name) for name in self.names]
+        self.prefixes = sorted((key, i) for i, key in enumerate(keys))
+        # Every word of a name but the first starts a suffix to prefix-match.
+        self.words = sorted((key[m.start():], i) for i, key in enumerate(keys)
+                            for m in re.finditer(r'(?<= )\S', key))
+        self.sid_prefixes = sorted((sid, i) for i, sids in enumerate(self.sids) for sid in sids)
+
+        postings = defaultdict(list)
+        for i, key in enumerate(keys):
+            for gram in trigrams(key):
+                postings[gram].append(i)
+        self.postings = {gram: np.asarray(rows, dtype=np.int32) for gram, rows in postings.items()}
+        self.gram_counts = np.array([len(trigrams(key)) for key in keys], dtype=np.int32)
+
+    def __len__(self):
+        return len(self.names)
+
+    @staticmethod
+    def _prefix_matches(entries, text, found, limit):
+        start = bisect.bisect_left(entries, (text,))
+        for key, i in entries[start:]:
+            if len(found) >= limit or not key.startswith(text):
+                break
+            found.setdefault(i, None)
+
+    def search(self, text, limit=LIMIT):
+        """Names best matching ``text``; without text, the first ``limit`` names."""
+        text = normalize(text)
+        if not text:
+            return self.names[:limit]
+        found = {}
+        self._prefix_matches(self.prefixes, text, found, limit)
+        self._prefix_matches(self.words, text, found, limit)
+        if text.isdigit():
+            self._prefix_matches(self.sid_prefixes, text, found, limit)
+        if len(found) < limit:
+            for i in self.similar(text, limit):
+                if len(found) >= limit:
+                    break
+                found.setdefault(i, None)
+        return [self.names[i] for i in found]
+
+    def similar(self, text, limit):
+        """Entries sharing the most trigrams with ``text``, most similar first."""
+        grams = [self.postings[g] for g in trigrams(text) if g in self.postings]
+        if not grams:
+            return []
+        n = len(trigrams(text))
+        shared = np.bincount(np.concatenate(grams), minlength=len(self.names))
+        candidates = np.nonzero(shared >= MIN_SIMILARITY * n)[0]
+        # Most of the text's trigrams first; among those, names with a word
+        # starting like the text (typos are rarely in the first letters:
+        # FEDX is FEDEX CORP rather than CAREDX INC), then names with fewer
+        # other trigrams (Jaccard), then alphabetical (entry order).
+        hits = shared[candidates]
+        leading = np.isin(candidates, self.postings.get(' ' + text[:2], []))
+        jaccard = hits / (n + self.gram_counts[candidates] - hits)
+        order = np.lexsort((candidates, -jaccard, ~leading, -hits))[:limit]
+        return candidates[order].tolist()
+
+    def sid_text(self, name):
+        """SIDs of ``name``, space separated."""
+        i = bisect.bisect_left(self.names, name)
+        return ' '.join(self.sids[i]) if i < len(self.names) and self.names[i] == name else ''
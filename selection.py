@@ -0,0 +1,58 @@
+"""Companies inside a box or lasso selection on a 2D map.
+
+``dcc.Graph`` reports a box selection as ``selectedData['range']`` and a lasso
+as ``selectedData['lassoPoints']``.  ``region_rows`` resolves either against
+the year's 2D ``EmbeddingIndex`` (see spatial.py) instead of reading the
+selected ``points``, so it finds every company in the region even when the
+figure draws aggregated markers (``LOD_POINTS``).  ``summary`` describes the
+selected rows: their mean position and how many fall in each ML and each
+GICS group at the level of a grouping column.
+"""
+import numpy as np
+
+from indexes import HOVER_FAMILIES, HOVER_LABELS, group_labels
+
+
+# The ML grouping at the same level as each GICS one.
+ML_FAMILIES = {gics: grp for grp, gics in HOVER_FAMILIES.items() if grp.startswith('ML_')}
+
+
+def axis_values(values, axis):
+    # Subplots name their axes x2, y2, ...; the maps have one of each.
+    return next((v for k, v in sorted(values.items()) if k.startswith(axis)), None)
+
+
+def region_rows(index, selected):
+    """Rows of a 2D ``index`` inside the region of ``selected``, in row order; None without a region."""
+    if not selected:
+        return None
+    try:
+        if selected.get('range'):
+            x, y = sorted(axis_values(selected['range'], 'x')), sorted(axis_values(selected['range'], 'y'))
+            return index.query_box([x[0], y[0]], [x[1], y[1]])
+        if selected.get('lassoPoints'):
+            x, y = axis_values(selected['lassoPoints'], 'x'), axis_values(selected['lassoPoints'], 'y')
+            return index.query_polygon(np.column_stack([x, y]))
+    except (TypeError, ValueError):
+        pass
+    return None
+
+
+def group_counts(df, idx, rows, grp):
+    """``[{'Group': name, 'Companies': n}]`` for the ``grp`` groups of ``rows``, largest first."""
+    counts = np.bincount(idx.group_codes[grp][rows], minlength=len(idx.group_values[grp]))
+    codes = np.flatnonzero(counts)
+    codes = codes[np.argsort(-counts[codes], kind='stable')]
+    return [{'Group': label, 'Companies': n} for label, n in zip(group_labels(df, idx, grp, codes), counts[codes].tolist())]
+
+
+def summary(df, idx, index, rows, grp):
+    """Count, mean position and per-group counts of the selected ``rows``."""
+    gics = HOVER_FAMILIES[grp]
+    return {
+        'count': len(rows),
+        'mean': index.points[rows].mean(axis=0).tolist() if len(rows) else None,
+        'level': HOVER_LABELS[gics],
+        'ml': group_counts(df, idx, rows, ML_FAMILIES[gics]),
+        'gics': group_counts(df, idx, rows, gics),
+    }
@@ -0,0 +1,138 @@
+"""Nearest-neighbor and radius queries over the TSNE embeddings.
+
+``d_matrix_<year>.csv`` only lists each company's 20 nearest names.  An
+``EmbeddingIndex`` answers k-nearest, within-radius and within-box queries
+for any k, for one point or a whole batch, over a year's 2D or 3D
+coordinates, and within-polygon (lasso) queries over 2D ones.  It uses
+SciPy's ``cKDTree`` when SciPy is installed; otherwise it falls back to
+exact brute force in NumPy, which for a few thousand points is still well
+under a millisecond per query.
+"""
+import numpy as np
+
+try:
+    from scipy.spatial import cKDTree
+except ImportError:
+    cKDTree = None
+
+
+# Brute-force queries work on blocks of this many points at a time, so a
+# batch never materializes more than CHUNK x N distances.
+CHUNK = 256
+
+
+class EmbeddingIndex:
+
+    def __init__(self, points):
+        self.points = np.ascontiguousarray(points, dtype=np.float64)
+        self.tree = cKDTree(self.points) if cKDTree is not None else None
+        # Rows sorted by the first axis, for box queries.
+        self.x_order = np.argsort(self.points[:, 0], kind='stable')
+        self.x_sorted = self.points[self.x_order, 0]
+
+    def __len__(self):
+        return len(self.points)
+
+    def _sq_distances(self, query):
+        diff = query[:, None, :] - self.points[None, :, :]
+        return np.einsum('ijk,ijk->ij', diff, diff)
+
+    def query(self, points, k):
+        """Return ``(distances, rows)`` of the ``k`` nearest points to each of ``points``, nearest first."""
+        points = np.atleast_2d(np.asarray(points, dtype=np.float64))
+        k = min(int(k), len(self))
+        if k <= 0 or not len(points):
+            return np.empty((len(points), 0)), np.empty((len(points), 0), dtype=np.intp)
+        if self.tree is not None:
+            dist, rows = self.tree.query(points, k=k)
+            return dist.reshape(len(points), k), rows.reshape(len(points), k).astype(np.intp)
+
+        dist = np.empty((len(points), k))
+        rows = np.empty((len(points), k), dtype=np.intp)
+        for start in range(0, len(points), CHUNK):
+            d2 = self._sq_distances(points[start:start + CHUNK])
+            part = np.argpartition(d2, k - 1, axis=1)[:, :k] if k < len(self) else np.broadcast_to(np.arange(len(self)), d2.shape)
+            part_d2 = np.take_along_axis(d2, part, axis=1)
+            # Sort by distance, breaking ties by row like cKDTree.
+            order = np.lexsort((part, part_d2), axis=1)
+            rows[start:start + CHUNK] = np.take_along_axis(part, order, axis=1)
+            dist[start:start + CHUNK] = np.sqrt(np.take_along_axis(part_d2, order, axis=1))
+        return dist, rows
+
+    def neighbor_rows(self, rows, k):
+        """``k`` nearest neighbors of each of ``rows``, as an ``(len(rows), k + 1)`` row matrix.
+
+        Column 0 is always the row itself, even when other points share its
+        coordinates, matching the layout of ``data_store.neighbor_matrix``.
+        """
+        rows = np.asarray(rows, dtype=np.intp)
+        k = min(int(k), len(self) - 1)
+        if not len(rows):
+            return np.empty((0, k + 1), dtype=np.intp)
+        dist, out = self.query(self.points[rows], k + 1)
+        # Pull each row to the front; if it was crowded out by duplicates,
+        # shift the others right and drop the farthest.
+        dist = np.where(out == rows[:, None], -1.0, dist)
+        out = np.take_along_axis(out, np.argsort(dist, axis=1, kind='stable'), axis=1)
+        missing = out[:, 0] != rows
+        out[missing, 1:] = out[missing, :-1]
+        out[missing, 0] = rows[missing]
+        return out
+
+    def query_radius(self, points, r):
+        """Rows within distance ``r`` of each of ``points``, as a list of arrays sorted nearest first."""
+        points = np.atleast_2d(np.asarray(points, dtype=np.float64))
+        if self.tree is not None:
+            hits = [np.asarray(h, dtype=np.intp) for h in self.tree.query_ball_point(points, r)]
+        else:
+            hits = []
+            for start in range(0, len(points), CHUNK):
+                hits.extend(np.flatnonzero(row <= r * r) for row in self._sq_distances(points[start:start + CHUNK]))
+        out = []
+        for point, h in zip(points, hits):
+            d2 = np.sum((self.points[h] - point) ** 2, axis=1)
+            out.append(h[np.lexsort((h, d2))])
+        return out
+
+    def query_box(self, lo, hi):
+        """Rows with ``lo <= point <= hi`` on every axis, in row order; bounds may be infinite."""
+        lo, hi = np.asarray(lo, dtype=np.float64), np.asarray(hi, dtype=np.float64)
+        start = np.searchsorted(self.x_sorted, lo[0], side='left')
+        stop = np.searchsorted(self.x_sorted, hi[0], side='right')
+        rows = self.x_order[start:stop]
+        points = self.points[rows]
+        return np.sort(rows[np.all((points >= lo) & (points <= hi), axis=1)])
+
+    def query_polygon(self, polygon):
+        """Rows of a 2D index inside ``polygon`` (a sequence of ``(x, y)`` vertices), in row order."""
+        polygon = np.asarray(polygon, dtype=np.float64).reshape(-1, 2)
+        if len(polygon) < 3:
+            return np.empty(0, dtype=np.intp)
+        rows = self.query_box(polygon.min(axis=0), polygon.max(axis=0))
+        return rows[points_in_polygon(self.points[rows], polygon)]
+
+
+def points_in_polygon(points, polygon):
+    """Boolean mask of the 2D ``points`` inside ``polygon``, by the even-odd rule."""
+    x0, y0 = polygon[:, 0], polygon[:, 1]
+    x1, y1 = np.roll(x0, -1), np.roll(y0, -1)
+    # Edges parallel to the ray never cross it; keep them from dividing by 0.
+    slope = (x1 - x0) / np.where(y1 != y0, y1 - y0, 1.0)
+    # Each edge is only compared with the points in its band of y, found by
+    # binary search in the points sorted by y: all (point, edge) pairs are
+    # built at once, without the full points x edges matrix.
+    order = np.argsort(points[:, 1], kind='stable')
+    ys = points[order, 1]
+    start = np.searchsorted(ys, np.minimum(y0, y1), side='left')
+    counts = np.searchsorted(ys, np.maximum(y0, y1), side='left') - start
+    edge = np.repeat(np.arange(len(polygon)), counts)
+    rows = order[np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts - start, counts)]
+    # A ray from each point towards +x crosses an odd number of edges iff inside.
+    crosses = points[rows, 0] < x0[edge] + (points[rows, 1] - y0[edge]) * slope[edge]
+    return np.bincount(rows[crosses], minlength=len(points)) % 2 == 1
+
+
+def embedding_indexes(df, method='TSNE'):
+    """``{2: EmbeddingIndex, 3: EmbeddingIndex}`` over a year's frame."""
+    return {dim: EmbeddingIndex(df[[axis + str(dim) + method for axis in 'XYZ'[:dim]]].to_numpy())
+            for dim in (2, 3)}
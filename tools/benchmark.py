@@ -0,0 +1,278 @@
+"""Benchmark ``generate_vis`` for every view, dimension and year.
+
+    python -m tools.benchmark [--repeat 5] [--out bench.json]
+    python -m tools.benchmark --compare bench.json [--threshold 0.25]
+    python -m tools.benchmark --golden tools/golden_figures.json [--update-golden]
+
+Each case (OVERALL, KERNEL, MULTI-KERNEL with 1/5/25 companies, NEAREST
+NEIGHBORS with k=1/10/20, in 2D and 3D, per year) is timed in three stages:
+``filter`` (selecting the rows), ``figure`` (building the Plotly figure) and
+``json`` (serializing it like Dash does); ``total`` also includes the glue in
+between.  Per-stage times are medians over ``--repeat`` runs.
+
+``--compare`` exits with status 1 when a case's total got slower than the
+given results by more than ``--threshold`` (and by at least ``--min-ms``).
+
+``--golden`` checks that every case draws the same points, colors and hover
+text as recorded in the golden file.  Its ``figures`` are the digests of the
+baseline commit's figures (``baseline``), and ``changes`` lists the intended
+differences since, each with its reason and the digests that replace the
+baseline ones: MULTI-KERNEL no longer draws a group once per selected company
+in it, and NEAREST NEIGHBORS no longer draws every share class of a
+neighbor's name.  ``--update-golden`` replaces the file with a snapshot of the
+current figures, with no changes.  ``--golden`` also checks that the compact
+encoding and pre-rendered artifacts agree with the default figures, and that
+``figure_key`` tells apart views that draw different figures.
+"""
+import argparse
+import hashlib
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import warnings
+
+import numpy as np
+import plotly
+
+warnings.filterwarnings('ignore', module='app')
+
+import app
+from data_store import DATA_DIR, YEARS
+import prerender
+from timings import collect
+
+
+GROUP = 'ML_sector'
+DIMS = [2, 3]
+
+
+def companies_for(year, n):
+    """``n`` distinct, evenly spread companies of ``year``, always the same ones."""
+    idx = app.yr_idx_dict[year]
+    names = sorted(name for name, row in idx.name_rows.items())
+    picks = np.linspace(0, len(names) - 1, n).round().astype(int)
+    return [names[i] for i in picks]
+
+
+def cases(years=YEARS, dims=DIMS, grp=GROUP):
+    for yr in years:
+        for dim in dims:
+            yield (yr, dim, 'OVERALL', grp, None, 1)
+            yield (yr, dim, 'KERNEL', grp, companies_for(yr, 1)[0], 1)
+            for n in (1, 5, 25):
+                yield (yr, dim, 'MULTI-KERNEL', grp, companies_for(yr, n), 1)
+            for k in (1, 10, 20):
+                yield (yr, dim, 'NEAREST NEIGHBORS', grp, companies_for(yr, 1)[0], k)
+
+
+def case_id(case):
+    yr, dim, vis, grp, companies, k = case
+    name = {'MULTI-KERNEL': 'MULTI-KERNEL-%d' % len(companies or []), 'NEAREST NEIGHBORS': 'NEAREST-NEIGHBORS-%d' % k}
+    return '%s/%dd/%s/%s' % (yr, dim, name.get(vis, vis), grp)
+
+
+def render(case, **kwargs):
+    yr, dim, vis, grp, companies, k = case
+    company = companies if vis == 'KERNEL' else None
+    return app.generate_vis(app.yr_df_dict[yr], year=int(yr), dim=dim, vis_type=vis, grp=grp, company=company,
+                            companies=companies, num_neighbors=k, size=8, **kwargs)
+
+
+def to_json(fig):
+    return json.dumps(fig.to_plotly_json(), cls=plotly.utils.PlotlyJSONEncoder)
+
+
+def time_case(case, repeat):
+    runs = []
+    for _ in range(repeat):
+        with collect() as t:
+            start = time.perf_counter()
+            fig = render(case)
+            mid = time.perf_counter()
+            data = to_json(fig)
+            end = time.perf_counter()
+        runs.append({'filter': t.get('filter', 0.0), 'figure': t.get('figure', 0.0),
+                     'json': end - mid, 'total': end - start})
+    out = {stage + '_ms': 1000 * statistics.median(r[stage] for r in runs) for stage in runs[0]}
+    out['bytes'] = len(data)
+    return out
+
+
+def run(repeat, years=YEARS):
+    all_cases = list(cases(years))
+    for case in all_cases:
+        # Load every year and index before timing anything.
+        render(case)
+    results = {case_id(case): time_case(case, repeat) for case in all_cases}
+    return {'meta': meta(repeat), 'cases': results}
+
+
+def meta(repeat):
+    try:
+        rev = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                             cwd=DATA_DIR).stdout.strip() or None
+    except OSError:
+        rev = None
+    import dash
+    import pandas as pd
+    return {
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'git': rev,
+        'repeat': repeat,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'plotly': plotly.__version__,
+        'dash': dash.__version__,
+    }
+
+
+def compare(new, old, threshold, min_ms):
+    regressions = []
+    for cid, r in new['cases'].items():
+        if cid not in old['cases']:
+            continue
+        before, after = old['cases'][cid]['total_ms'], r['total_ms']
+        if after > before * (1 + threshold) and after - before >= min_ms:
+            regressions.append((cid, before, after))
+    return regressions
+
+
+def points(fig):
+    """Sorted ``(hover, color, x, y[, z])`` rows of every trace of a figure dict.
+
+    Decodes the compact encoding (color codes into ``layout.coloraxis``,
+    hover labels in ``hovertemplate``) so both forms compare equal.
+    """
+    layout = fig.get('layout', {})
+    rows = []
+    for trace in fig['data']:
+        marker = trace.get('marker', {})
+        colors = decode(marker.get('color'))
+        if marker.get('coloraxis'):
+            scale = layout['coloraxis']['colorscale']
+            palette = [c for _, c in scale[::2]] if len(scale) > 2 else [scale[0][1]]
+            colors = [palette[int(c)] for c in colors]
+        if 'hovertext' in trace:
+            hover = list(decode(trace['hovertext']))
+        else:
+            template = trace['hovertemplate'].replace('<extra></extra>', '')
+            hover = [template.replace('%{text}', t) for t in decode(trace['text'])]
+        coords = [np.asarray(decode(trace[axis]), dtype=np.float64) for axis in ('x', 'y', 'z') if axis in trace]
+        rows.extend(zip(hover, list(colors), *[c.tolist() for c in coords]))
+    return sorted(rows)
+
+
+def decode(values):
+    # Plotly >= 6 ships numeric arrays as base64 typed arrays.
+    if isinstance(values, dict) and 'bdata' in values:
+        import base64
+        return np.frombuffer(base64.b64decode(values['bdata']), dtype=values['dtype'])
+    return values if values is not None else []
+
+
+def digest(fig):
+    h = hashlib.sha256()
+    for row in points(fig):
+        h.update(json.dumps([row[0], row[1]] + [round(v, 9) for v in row[2:]]).encode())
+    return h.hexdigest()
+
+
+def same_points(a, b, atol):
+    if len(a) != len(b):
+        return False
+    # Share classes repeat a name, so points are matched by coordinates
+    # within each (hover, color) group rather than by sort position.
+    groups = {}
+    for p in b:
+        groups.setdefault(p[:2], []).append(np.asarray(p[2:]))
+    for p in a:
+        candidates = groups.get(p[:2], [])
+        hit = next((i for i, q in enumerate(candidates) if np.allclose(p[2:], q, atol=atol)), None)
+        if hit is None:
+            return False
+        candidates.pop(hit)
+    return True
+
+
+def check_keys(yr=YEARS[-1], grp=GROUP):
+    # Views drawing different figures must not share a figure cache entry.
+    a, b = companies_for(yr, 2)
+    failures = []
+    if app.figure_key('NEAREST NEIGHBORS', grp, yr, [a, b], 2, 5) == app.figure_key('NEAREST NEIGHBORS', grp, yr, [b, a], 2, 5):
+        failures.append('figure_key: NEAREST NEIGHBORS anchored on %s and on %s share a key' % (a, b))
+    return failures
+
+
+def check_golden(path, update):
+    figures = {case_id(case): json.loads(to_json(render(case))) for case in cases()}
+    failures = check_keys()
+    digests = {cid: digest(fig) for cid, fig in figures.items()}
+    if update:
+        with open(path, 'w') as f:
+            json.dump({'baseline': meta(0)['git'], 'figures': digests, 'changes': []}, f, indent=1, sort_keys=True)
+    else:
+        with open(path) as f:
+            golden = json.load(f)
+        expected = dict(golden['figures'])
+        for change in golden['changes']:
+            expected.update(change['figures'])
+        failures += ['%s: differs from golden' % cid for cid in expected if digests.get(cid) != expected[cid]]
+
+    precision = app.figure_options['precision']
+    for case in cases():
+        cid = case_id(case)
+        expected = points(figures[cid])
+        compact = json.loads(to_json(render(case, compact=True, precision=precision)))
+        if not same_points(points(compact), expected, atol=10 ** -precision):
+            failures.append('%s: compact figure differs' % cid)
+        yr, dim, vis, grp = case[:4]
+        if vis == 'OVERALL':
+            served = prerender.load(yr, grp, str(dim), options=app.figure_options)
+            if served is not None and not same_points(points(served), expected, atol=10 ** -precision):
+                failures.append('%s: pre-rendered figure differs' % cid)
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--years', nargs='+', default=YEARS)
+    parser.add_argument('--out', help='write results to this JSON file')
+    parser.add_argument('--compare', help='fail on regressions against this results file')
+    parser.add_argument('--threshold', type=float, default=0.25, help='allowed slowdown, as a fraction (default 0.25)')
+    parser.add_argument('--min-ms', type=float, default=1.0, help='ignore slowdowns smaller than this')
+    parser.add_argument('--golden', help='check figures against this golden file instead of timing')
+    parser.add_argument('--update-golden', action='store_true')
+    args = parser.parse_args()
+
+    if args.golden:
+        failures = check_golden(args.golden, args.update_golden)
+        for failure in failures:
+            print(failure)
+        print('%d failures' % len(failures))
+        sys.exit(1 if failures else 0)
+
+    results = run(args.repeat, args.years)
+    print('%-40s %9s %9s %9s %9s %9s' % ('case', 'filter', 'figure', 'json', 'total', 'KB'))
+    for cid, r in results['cases'].items():
+        print('%-40s %9.2f %9.2f %9.2f %9.2f %9.1f' % (
+            cid, r['filter_ms'], r['figure_ms'], r['json_ms'], r['total_ms'], r['bytes'] / 1024))
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(results, f, indent=1)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.threshold, args.min_ms)
+        for cid, before, after in regressions:
+            print('REGRESSION %s: %.2f ms -> %.2f ms' % (cid, before, after))
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
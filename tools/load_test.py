@@ -0,0 +1,297 @@
+"""Load test: simulated users replaying Dash callback traffic against a local server.
+
+    python -m tools.load_test [--concurrency 1 2 4 8 16] [--duration 20] [--workers 2]
+    python -m tools.load_test --url http://127.0.0.1:8050 ...
+
+Without ``--url`` the harness starts the app itself on a free localhost port:
+under gunicorn with ``gunicorn.conf.py`` when gunicorn is installed (``--workers``
+sets the worker count), otherwise on Flask's threaded development server.
+
+Each simulated user repeats a session like the browser would drive it:
+pick a view (weighted by ``--mix``), which fires ``update_disabled``, then
+``get_companies`` for a year and once per letter typed into the companies
+search, and ``update_graph``, followed by a few company or neighbor-count
+edits (zooms, for 2D OVERALL views with ``LOD_POINTS`` set) that each fire
+``update_graph`` again.  The request
+bodies follow the callback signatures the server publishes in
+``/_dash-dependencies``, and ``graph_state`` is carried from response to
+request as in the browser.
+
+For every concurrency step the report lists throughput and p50/p95/p99
+latency per callback; ``--json`` also writes them to a file.  Everything runs
+on 127.0.0.1.
+"""
+import argparse
+import http.client
+import json
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.parse
+import urllib.request
+
+import numpy as np
+
+from data_store import DATA_DIR, YEARS
+
+
+DEFAULT_MIX = 'OVERALL=4,MULTI-KERNEL=3,NEAREST NEIGHBORS=2,EMBEDDING NEIGHBORS=1'
+GROUPS = ['ML_sector', 'ML_industry', 'ML_subindustry', 'GICS_SECTOR', 'GICS_INDUSTRY', 'GICS_SUB_INDUSTRY']
+CALLBACKS = {
+    'update_graph': 'graph.figure',
+    'get_companies': 'companies.options',
+    'update_disabled': 'companies.disabled',
+}
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(workers):
+    port = free_port()
+    try:
+        import gunicorn  # noqa: F401
+        cmd = [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '-w', str(workers),
+               '-b', '127.0.0.1:%d' % port, 'app:server']
+    except ImportError:
+        cmd = [sys.executable, '-c', 'import app; app.server.run("127.0.0.1", %d, threaded=True)' % port]
+    proc = subprocess.Popen(cmd, cwd=DATA_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = 'http://127.0.0.1:%d' % port
+    deadline = time.time() + 180
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError('server exited with %s' % proc.returncode)
+        try:
+            urllib.request.urlopen(url + '/', timeout=5).read()
+            return proc, url
+        except OSError:
+            time.sleep(0.5)
+    proc.terminate()
+    raise RuntimeError('server did not start in time')
+
+
+def find_callbacks(url):
+    with urllib.request.urlopen(url + '/_dash-dependencies') as r:
+        deps = json.load(r)
+    found = {}
+    for name, output in CALLBACKS.items():
+        for dep in deps:
+            if output in output_ids(dep):
+                found[name] = dep
+                break
+    return found
+
+
+def output_ids(dep):
+    # Multi-output callbacks are published as "..a.prop...b.prop..".
+    return dep['output'].strip('.').split('...')
+
+
+def body(dep, values, triggered):
+    """Request body for callback ``dep`` given ``{'id.prop': value}`` for its inputs and state."""
+    def props(items):
+        return [{'id': i['id'], 'property': i['property'], 'value': values.get(i['id'] + '.' + i['property'])}
+                for i in items]
+
+    outputs = [{'id': o.split('.')[0], 'property': o.split('.')[1]} for o in output_ids(dep)]
+    return {
+        'output': dep['output'],
+        'outputs': outputs if dep['output'].startswith('..') else outputs[0],
+        'inputs': props(dep['inputs']),
+        'state': props(dep.get('state', [])),
+        'changedPropIds': [triggered],
+    }
+
+
+class User:
+
+    def __init__(self, url, callbacks, mix, rng, record):
+        parsed = urllib.parse.urlparse(url)
+        self.conn = http.client.HTTPConnection(parsed.hostname, parsed.port, timeout=120)
+        self.callbacks = callbacks
+        self.mix = mix
+        self.rng = rng
+        self.record = record
+        self.values = {'dimension_toggle.value': '2', 'num_neighbors.value': '1'}
+
+    def call(self, name, triggered):
+        dep = self.callbacks.get(name)
+        if dep is None:
+            return None
+        data = json.dumps(body(dep, self.values, triggered))
+        start = time.perf_counter()
+        try:
+            self.conn.request('POST', '/_dash-update-component', data, {'Content-Type': 'application/json'})
+            resp = self.conn.getresponse()
+            payload = resp.read()
+            ok = resp.status in (200, 204)
+        except (OSError, http.client.HTTPException):
+            self.conn.close()
+            payload, ok = b'', False
+        self.record(name, time.perf_counter() - start, ok)
+        if not ok or not payload:
+            return None
+        response = json.loads(payload).get('response', {})
+        for comp, props in response.items():
+            for prop, value in props.items():
+                self.values[comp + '.' + prop] = value
+        return response
+
+    def session(self):
+        rng = self.rng
+        views, weights = zip(*self.mix.items())
+        vis = rng.choices(views, weights)[0]
+        self.values.update({
+            'visualization_model.value': vis,
+            'cluster_group.value': rng.choice(GROUPS),
+            'year.value': rng.choice(YEARS),
+            'dimension_toggle.value': rng.choice(['2', '3']),
+            'companies.search_value': None,
+            'companies.value': None,
+            'graph.relayoutData': None,
+        })
+        self.call('update_disabled', 'visualization_model.value')
+        self.call('get_companies', 'year.value')
+        if vis != 'OVERALL':
+            typed = ''
+            for _ in range(rng.randint(1, 3)):
+                typed += rng.choice('ABCDEFGHIJKLMNOPRSTUW')
+                self.values['companies.search_value'] = typed
+                self.call('get_companies', 'companies.search_value')
+        names = [o['value'] for o in self.values.get('companies.options') or []]
+        if vis != 'OVERALL' and not names:
+            return
+        self.select(vis, names)
+        self.call('update_graph', 'visualization_model.value')
+        for _ in range(rng.randint(0, 3)):
+            # Follow-up edits: the callbacks update_graph can patch.
+            if vis == 'NEAREST NEIGHBORS':
+                self.values['num_neighbors.value'] = str(rng.randint(1, 20))
+                self.call('update_graph', 'num_neighbors.value')
+            elif vis != 'OVERALL':
+                self.select(vis, names)
+                self.call('update_graph', 'companies.value')
+            elif self.values['dimension_toggle.value'] == '2' and self.zoomable():
+                x, y, half = rng.uniform(-40, 40), rng.uniform(-40, 40), rng.uniform(2, 20)
+                self.values['graph.relayoutData'] = {'xaxis.range[0]': x - half, 'xaxis.range[1]': x + half,
+                                                     'yaxis.range[0]': y - half, 'yaxis.range[1]': y + half}
+                self.call('update_graph', 'graph.relayoutData')
+
+    def zoomable(self):
+        # update_graph only takes relayoutData when LOD_POINTS is set.
+        dep = self.callbacks.get('update_graph')
+        return dep is not None and {'id': 'graph', 'property': 'relayoutData'} in dep['inputs']
+
+    def select(self, vis, names):
+        rng = self.rng
+        if vis == 'NEAREST NEIGHBORS':
+            self.values['companies.value'] = rng.choice(names)
+            self.values['num_neighbors.value'] = str(rng.randint(1, 20))
+        elif vis == 'EMBEDDING NEIGHBORS':
+            self.values['companies.value'] = rng.sample(names, rng.randint(1, min(3, len(names))))
+            self.values['num_neighbors.value'] = str(rng.choice([10, 50, 100, 500]))
+        elif vis == 'MULTI-KERNEL':
+            self.values['companies.value'] = rng.sample(names, rng.randint(1, min(5, len(names))))
+        else:
+            self.values['companies.value'] = None
+
+
+def run_step(url, callbacks, mix, concurrency, duration, seed):
+    samples = {name: [] for name in CALLBACKS}
+    errors = {name: 0 for name in CALLBACKS}
+    lock = threading.Lock()
+    stop = time.time() + duration
+
+    def record(name, seconds, ok):
+        with lock:
+            if ok:
+                samples[name].append(seconds)
+            else:
+                errors[name] += 1
+
+    def loop(i):
+        user = User(url, callbacks, mix, random.Random(seed * 1000 + i), record)
+        while time.time() < stop:
+            user.session()
+
+    threads = [threading.Thread(target=loop, args=(i,), daemon=True) for i in range(concurrency)]
+    start = time.time()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.time() - start
+
+    result = {'concurrency': concurrency, 'seconds': elapsed, 'callbacks': {}}
+    total = 0
+    for name, values in samples.items():
+        if name not in callbacks:
+            continue
+        ms = np.asarray(values) * 1000
+        total += len(values)
+        result['callbacks'][name] = {
+            'requests': len(values),
+            'errors': errors[name],
+            'rps': len(values) / elapsed,
+            'p50_ms': float(np.percentile(ms, 50)) if len(ms) else None,
+            'p95_ms': float(np.percentile(ms, 95)) if len(ms) else None,
+            'p99_ms': float(np.percentile(ms, 99)) if len(ms) else None,
+        }
+    result['rps'] = total / elapsed
+    return result
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(','):
+        view, weight = part.rsplit('=', 1)
+        mix[view.strip()] = float(weight)
+    return mix
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--url', help='target an already running server instead of starting one')
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn workers when starting the server')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 2, 4, 8, 16])
+    parser.add_argument('--duration', type=float, default=20, help='seconds per concurrency step')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help='view weights, e.g. "OVERALL=1,MULTI-KERNEL=2"')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args()
+
+    proc = None
+    url = args.url
+    if url is None:
+        proc, url = start_server(args.workers)
+    try:
+        callbacks = find_callbacks(url)
+        if 'update_graph' not in callbacks:
+            print('update_graph is not a server callback here (CLIENTSIDE_FIGURES?); timing the others only')
+        results = []
+        print('%5s %-16s %8s %7s %9s %9s %9s %7s' % ('users', 'callback', 'requests', 'req/s', 'p50 ms', 'p95 ms', 'p99 ms', 'errors'))
+        for n in args.concurrency:
+            r = run_step(url, callbacks, parse_mix(args.mix), n, args.duration, args.seed)
+            results.append(r)
+            for name, c in r['callbacks'].items():
+                fmt = lambda v: '%9.1f' % v if v is not None else '%9s' % '-'
+                print('%5d %-16s %8d %7.1f %s %s %s %7d' % (
+                    n, name, c['requests'], c['rps'], fmt(c['p50_ms']), fmt(c['p95_ms']), fmt(c['p99_ms']), c['errors']))
+            print('%5d %-16s %8s %7.1f' % (n, 'all', '', r['rps']))
+        if args.json:
+            with open(args.json, 'w') as f:
+                json.dump({'url': url, 'mix': parse_mix(args.mix), 'steps': results}, f, indent=1)
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait()
+
+
+if __name__ == '__main__':
+    main()
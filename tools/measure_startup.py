@@ -0,0 +1,75 @@
+"""Cold-start time and peak RSS of the data layer, one fresh interpreter per mode.
+
+    python -m tools.measure_startup [--repeat N]
+
+``eager-csv`` reproduces the old import-time behaviour (14 ``pd.read_csv``
+calls); the other modes go through ``data_store``.  Dash itself is not
+imported, so the numbers isolate the data loading cost.
+"""
+import argparse
+import json
+import subprocess
+import sys
+
+
+SNIPPETS = {
+    'eager-csv': """
+import pandas as pd
+from data_store import YEARS, csv_path
+dfs = [pd.read_csv(csv_path(kind, yr)) for kind in ('cons_data1', 'd_matrix') for yr in YEARS]
+""",
+    'lazy-import': """
+from data_store import LazyYearDict, load_frame
+yr_df_dict = LazyYearDict(lambda yr: load_frame('cons_data1', yr))
+yr_dm_dict = LazyYearDict(lambda yr: load_frame('d_matrix', yr))
+""",
+    'lazy-one-year': """
+from data_store import LazyYearDict, load_frame
+yr_df_dict = LazyYearDict(lambda yr: load_frame('cons_data1', yr))
+yr_dm_dict = LazyYearDict(lambda yr: load_frame('d_matrix', yr))
+yr_df_dict['2019'], yr_dm_dict['2019']
+""",
+    'warm-parallel': """
+from data_store import LazyYearDict, load_frame, warm
+yr_df_dict = LazyYearDict(lambda yr: load_frame('cons_data1', yr))
+yr_dm_dict = LazyYearDict(lambda yr: load_frame('d_matrix', yr))
+warm(yr_df_dict, yr_dm_dict)
+""",
+}
+
+HARNESS = """
+import json, resource, time
+base = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+import numpy, pandas
+start = time.perf_counter()
+{snippet}
+elapsed = time.perf_counter() - start
+rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({{'seconds': elapsed, 'rss_mb': rss / 1024.0}}))
+"""
+
+
+def run(snippet):
+    out = subprocess.run([sys.executable, '-c', HARNESS.format(snippet=snippet)],
+                         check=True, capture_output=True, text=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    from data_store import build_cache
+    build_cache()
+
+    print('%-15s %12s %12s' % ('mode', 'load ms', 'peak RSS MB'))
+    for mode, snippet in SNIPPETS.items():
+        runs = [run(snippet) for _ in range(args.repeat)]
+        best = min(r['seconds'] for r in runs)
+        rss = max(r['rss_mb'] for r in runs)
+        print('%-15s %12.1f %12.1f' % (mode, best * 1000, rss))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+"""Memory of a gunicorn deployment as the number of workers grows.
+
+    python -m tools.measure_workers [--workers 1 2 4 8 16] [--json out.json]
+
+Starts ``gunicorn app:server`` twice per worker count:
+
+* ``separate``: no preloading; every worker imports the app and loads all
+  years itself (``PRELOAD_DATA=1``), like the old Procfile.
+* ``shared``: ``gunicorn.conf.py``; the master loads everything once with
+  memory-mapped arrays and the workers are forked from it.
+
+For each run it reads ``/proc/<pid>/smaps_rollup`` after memory settles and
+reports the mean worker RSS, the mean worker private (unshared) memory, and
+the PSS summed over master and workers, which counts shared pages once.
+Linux only.
+"""
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def smaps(pid):
+    out = {}
+    with open('/proc/%d/smaps_rollup' % pid) as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == 'kB':
+                out[parts[0].rstrip(':')] = int(parts[1]) / 1024.0
+    return {'rss': out['Rss'], 'pss': out['Pss'],
+            'private': out['Private_Clean'] + out['Private_Dirty']}
+
+
+def children(pid):
+    with open('/proc/%d/task/%d/children' % (pid, pid)) as f:
+        return [int(p) for p in f.read().split()]
+
+
+def wait_ready(proc, port, n, timeout=180):
+    deadline = time.time() + timeout
+    url = 'http://127.0.0.1:%d/' % port
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError('gunicorn exited with %s' % proc.returncode)
+        try:
+            urllib.request.urlopen(url, timeout=5).read()
+            if len(children(proc.pid)) == n:
+                break
+        except OSError:
+            pass
+        time.sleep(0.5)
+    else:
+        raise RuntimeError('gunicorn did not start in %ds' % timeout)
+
+    # Workers may still be importing and loading; wait for memory to settle.
+    last = None
+    while time.time() < deadline:
+        total = sum(smaps(p)['rss'] for p in [proc.pid] + children(proc.pid))
+        if last is not None and abs(total - last) < 0.01 * last:
+            return
+        last = total
+        time.sleep(1.0)
+
+
+def measure(mode, n):
+    port = free_port()
+    env = dict(os.environ)
+    env.pop('DATA_MMAP', None)
+    env['PRELOAD_DATA'] = '1'
+    if mode == 'shared':
+        config = 'gunicorn.conf.py'
+    else:
+        fd, config = tempfile.mkstemp(suffix='.py')
+        os.close(fd)
+    cmd = [sys.executable, '-m', 'gunicorn', '-c', config, '-w', str(n), '-b', '127.0.0.1:%d' % port, 'app:server']
+    proc = subprocess.Popen(cmd, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_ready(proc, port, n)
+        master = smaps(proc.pid)
+        workers = [smaps(p) for p in children(proc.pid)]
+    finally:
+        proc.terminate()
+        proc.wait()
+        if mode != 'shared':
+            os.remove(config)
+    return {
+        'mode': mode,
+        'workers': n,
+        'master_rss_mb': master['rss'],
+        'worker_rss_mb': sum(w['rss'] for w in workers) / len(workers),
+        'worker_private_mb': sum(w['private'] for w in workers) / len(workers),
+        'total_pss_mb': master['pss'] + sum(w['pss'] for w in workers),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8, 16])
+    parser.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args()
+
+    from data_store import build_cache
+    build_cache()
+
+    results = []
+    print('%-9s %7s %12s %12s %14s %14s' % ('mode', 'workers', 'master RSS', 'worker RSS', 'worker private', 'total PSS MB'))
+    for n in args.workers:
+        for mode in ('separate', 'shared'):
+            r = measure(mode, n)
+            results.append(r)
+            print('%-9s %7d %12.1f %12.1f %14.1f %14.1f' % (
+                mode, n, r['master_rss_mb'], r['worker_rss_mb'], r['worker_private_mb'], r['total_pss_mb']))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+"""Serialized figure size per view, default vs compact encoding.
+
+    python -m tools.payload_report [--year 2019] [--precision 3]
+
+Sizes are the JSON Dash sends for the ``graph.figure`` output, raw and gzipped.
+"""
+import argparse
+import gzip
+import json
+
+import plotly
+
+import app
+
+
+def payload_bytes(fig):
+    data = json.dumps(fig, cls=plotly.utils.PlotlyJSONEncoder).encode()
+    return len(data), len(gzip.compress(data, 6))
+
+
+def views(year):
+    df = app.yr_df_dict[year]
+    companies = df['Name'].iloc[::max(len(df) // 5, 1)].tolist()[:5]
+    for grp in ['ML_sector', 'ML_subindustry', 'GICS_SECTOR', 'GICS_SUB_INDUSTRY']:
+        for dim in ('2', '3'):
+            yield 'OVERALL', grp, None, dim, '1'
+    for dim in ('2', '3'):
+        yield 'MULTI-KERNEL', 'ML_industry', companies, dim, '1'
+        yield 'NEAREST NEIGHBORS', 'ML_industry', companies[0], dim, '20'
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--year', default='2019')
+    parser.add_argument('--precision', type=int, default=3)
+    args = parser.parse_args()
+
+    print('%-18s %-18s %3s %10s %10s %9s %9s %6s' % (
+        'view', 'grouping', 'dim', 'default', 'compact', 'default.gz', 'compact.gz', 'ratio'))
+    totals = [0, 0]
+    for vis, grp, comps, dim, k in views(args.year):
+        df = app.yr_df_dict[args.year]
+        kwargs = dict(year=int(args.year), dim=int(dim), vis_type=vis, grp=grp, num_neighbors=int(k), companies=comps, size=8)
+        before = payload_bytes(app.generate_vis(df, **kwargs).to_plotly_json())
+        after = payload_bytes(app.generate_vis(df, compact=True, precision=args.precision, **kwargs).to_plotly_json())
+        totals[0] += before[0]
+        totals[1] += after[0]
+        print('%-18s %-18s %3s %10d %10d %9d %9d %5.1fx' % (
+            vis, grp, dim, before[0], after[0], before[1], after[1], before[0] / after[0]))
+    print('total raw bytes: %d -> %d (%.1fx)' % (totals[0], totals[1], totals[0] / totals[1]))
+
+
+if __name__ == '__main__':
+    main()